@@ -0,0 +1,262 @@
+"""
+Headless benchmarks for the requisition data path.
+
+Generates seeded synthetic requisition logs and stock catalogues, then times
+and memory-profiles the storage and search functions directly, so no display
+is needed. Results are written as JSON that a later run can compare against.
+
+    python benchmark.py
+    python benchmark.py --log-sizes 1000 100000 1000000 --stock-sizes 1000 100000
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+import requisition
+
+REQUESTERS = ["Roy", "Smily", "Thandeka", "Gideon", "Laloo", "Cosmos", "Jurgen", "Wynand", "Reggie", "SHEQ"]
+DEPARTMENTS = ["Stores", "Silflow", "Paddles", "Retanning Drums", "Health and Safety", "Electrical",
+               "Production General", "Ford Ranger", "Lime Fleshing", "Sammying Wetblue"]
+ITEM_WORDS = ["Bearing", "Nut", "Washer", "Bolt", "Thread Bar", "Valve", "Elbow", "Socket", "Glove", "Disc",
+              "Cable", "Terminal", "Contactor", "Timer", "Pipe", "Flange", "Housing", "Sleeve", "Belt", "Paint"]
+ITEM_SIZES = ["M8", "M10", "M12", "M16", "M20", "15mm", "22mm", "25mm", "50mm", "1½", "¾", "6205", "22224"]
+CATALOGUE_ENCODINGS = ["utf-8", "latin-1", "cp1252"]
+SEARCH_QUERIES = ["m", "m1", "bea", "bearing", "m12 nut", "½ soc", "zzz"]
+REQUISITION_QUERIES = ["roy", "stores bearing", "m12 nut", "0000002a", "thandeka glove 15mm", "zzz"]
+
+
+def item_name(rng):
+    return f"{rng.choice(ITEM_SIZES)} {rng.choice(ITEM_WORDS)} {rng.randint(1, 999)}"
+
+
+def item_count(rng):
+    # Most requisitions are one to three items, a few are whole project lists
+    return min(25, int(rng.expovariate(0.6)) + 1)
+
+
+def generate_requisition(rng, number, start):
+    return requisition.Requisition(
+        id=f"{number:08x}",
+        requester=rng.choice(REQUESTERS),
+        date=(start + timedelta(minutes=number * 7)).strftime('%Y-%m-%d %H:%M'),
+        status=requisition.Status.PENDING if rng.random() < 0.1 else requisition.Status.COMPLETED,
+        department=rng.choice(DEPARTMENTS),
+        items=[requisition.LineItem(item_name(rng), rng.randint(1, 200)) for _ in range(item_count(rng))],
+    )
+
+
+def write_log(path, size, seed):
+    """ Streams the XML out so a million requisitions never sit in memory at once """
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1, 7, 0)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<requisitions>")
+        for number in range(size):
+            req = generate_requisition(rng, number, start)
+            items = "".join(f"<Item><Name>{escape(name)}</Name><Quantity>{qty}</Quantity></Item>"
+                            for name, qty in req.items)
+            f.write(f"<requisition><ID>{req.id}</ID><Requester>{escape(req.requester)}</Requester>"
+                    f"<Date>{req.date}</Date><Status>{req.status}</Status>"
+                    f"<Department>{escape(req.department)}</Department><Items>{items}</Items></requisition>")
+        f.write("</requisitions>")
+
+
+def write_catalogue(path, size, seed, encoding):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        f.write("Inventory Description\r\n")
+        for _ in range(size):
+            f.write(f"{item_name(rng):<40}\r\n")  # Padded like the real export
+
+
+def measure(operation, size, work, setup=None, repeat=3, **extra):
+    """ Best wall time over repeat runs, then one more run under tracemalloc for peak memory.
+
+    Work that changes what it runs on needs a setup that puts it back, which
+    runs before every run, the profiled one included.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - started)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    work()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {"operation": operation, "size": size, "seconds": min(timings), "peak_bytes": peak}
+    result.update(extra)
+    print(f"{operation:<28} {size:>9} {min(timings) * 1000:>11.2f} ms {peak / 1024 / 1024:>9.1f} MiB")
+    return result
+
+
+def bench_log(workdir, size, seed, writes):
+    log_path = os.path.join(workdir, f"log_{size}.xml")
+    journal_path = os.path.join(workdir, f"log_{size}.journal")
+    archive_dir = os.path.join(workdir, f"archive_{size}")
+    write_log(log_path, size, seed)
+    repeat = 1 if size >= 100000 else 3
+    results = []
+
+    def reset_journal():
+        open(journal_path, 'w').close()
+
+    results.append(measure("load_requisitions", size,
+                           lambda: requisition.load_requisitions(log_path, journal_path),
+                           setup=reset_journal, repeat=repeat))
+    warm_path = os.path.join(workdir, f"log_{size}.warm")
+    reset_journal()
+    requisition.write_warm_start(warm_path, requisition.load_requisitions(log_path, journal_path),
+                                 requisition.XmlJournalStorage(log_path, journal_path).signature())
+    results.append(measure("warm_start_pending", size,
+                           lambda: next(requisition.read_warm_start(warm_path)), repeat=repeat))
+    results.append(measure("warm_start_load", size,
+                           lambda: list(requisition.read_warm_start(warm_path)), repeat=repeat))
+    results.append(measure("stream_first_50_pending", size,
+                           lambda: list(requisition.iter_requisitions(log_path, stop_after_pending=50)),
+                           repeat=repeat))
+
+    index = requisition.RequisitionIndex(requisition.XmlJournalStorage(log_path, journal_path, archive_dir))
+    index.rebuild()
+
+    def search_all():
+        for query in REQUISITION_QUERIES:
+            index.search.search(query, limit=500)
+
+    results.append(measure("search_requisitions", size, search_all, repeat=repeat, calls=len(REQUISITION_QUERIES)))
+    results.append(measure("consolidate_pending", size,
+                           lambda: requisition.PendingOrders.build(index.requisitions).purchase_order(by_department=True),
+                           repeat=repeat))
+    start = datetime(2020, 1, 1, 7, 0)
+    generated_path = log_path + ".generated"
+    shutil.copyfile(log_path, generated_path)
+
+    def restore():
+        shutil.copyfile(generated_path, log_path)
+        reset_journal()
+        index.rebuild()
+
+    def save_many():
+        rng = random.Random(seed + 1)
+        for number in range(size, size + writes):
+            index.add(generate_requisition(rng, number, start))
+
+    def update_many():
+        rng = random.Random(seed + 2)
+        for req in rng.sample(index.requisitions, min(writes, len(index.requisitions))):
+            index.set_status(req, requisition.Status.PENDING if req.status == requisition.Status.COMPLETED
+                             else requisition.Status.COMPLETED)
+
+    def write_journal():
+        restore()
+        save_many()
+        update_many()
+
+    # Every run, the profiled one too, writes the same batch to the same generated log
+    results.append(measure("save_to_xml", size, save_many, setup=restore, repeat=1, calls=writes))
+    results.append(measure("update_xml_status", size, update_many, setup=restore, repeat=1, calls=writes))
+    results.append(measure("compact_journal", size, lambda: requisition.compact_journal(log_path, journal_path),
+                           setup=write_journal, repeat=1))
+    os.remove(log_path)
+    os.remove(generated_path)
+    return results
+
+
+def bench_catalogue(workdir, size, seed, encoding):
+    csv_path = os.path.join(workdir, f"stock_{size}.csv")
+    cache_path = os.path.splitext(csv_path)[0] + '.cache'
+    write_catalogue(csv_path, size, seed, encoding)
+    results = []
+
+    def drop_cache():
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    results.append(measure("load_stock_items_cold", size, lambda: requisition.load_stock_items(csv_path),
+                           setup=drop_cache, encoding=encoding))
+    results.append(measure("load_stock_items_warm", size, lambda: requisition.load_stock_items(csv_path),
+                           encoding=encoding))
+
+    catalogue = requisition.load_stock_items(csv_path)
+
+    def search_all():
+        for query in SEARCH_QUERIES:
+            catalogue.search(query)
+
+    results.append(measure("update_combobox_search", size, search_all, calls=len(SEARCH_QUERIES)))
+    return results
+
+
+def compare(results, previous_path):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {(r["operation"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {previous_path}")
+    for result in results:
+        before = previous.get((result["operation"], result["size"]))
+        if not before or not before["seconds"]:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        flag = "  slower" if ratio > 1.1 else ""
+        print(f"{result['operation']:<28} {result['size']:>9} {ratio:>8.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the requisition data path without a display.")
+    parser.add_argument("--log-sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--stock-sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--writes", type=int, default=100, help="saves and status updates timed per log size")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="requisition-bench-")
+    results = []
+    try:
+        print(f"{'operation':<28} {'size':>9} {'time':>14} {'peak':>13}")
+        for size in args.log_sizes:
+            results.extend(bench_log(workdir, size, args.seed, args.writes))
+        # Each size gets the next encoding in turn, so the default sizes cover all of them
+        for size, encoding in zip(args.stock_sizes, itertools.cycle(CATALOGUE_ENCODINGS)):
+            results.extend(bench_catalogue(workdir, size, args.seed, encoding))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Command line access to the requisition log, without the Tk window.
+
+Works on the same storage as the app (REQUISITION_STORAGE, or --storage),
+so stations that have the app open pick the changes up on their next refresh.
+
+    python cli.py import supplier_sheet.csv
+    python cli.py import requisitions.jsonl --batch-size 200 --strict
+    python cli.py export --from 2024-10 --to 2024-10 --format csv -o october.csv
+    python cli.py export --status Pending --department Stores --format json
+    python cli.py export --archived --from 2023 --to 2023 -o 2023.csv
+    python cli.py status Completed --id 50781cd2 --id a51adf99
+    python cli.py status Completed --status Pending --to 2024-09 --dry-run
+    python cli.py order --by-department -o purchase-order.csv
+
+CSV files have one row per item with the columns ID, Requester, Date, Status,
+Department, Item and Quantity; consecutive rows with the same ID (or the same
+Requester and Date when there is no ID) make up one requisition. JSON files
+have one requisition per line, with the keys used in the journal.
+"""
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import sys
+import uuid
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+import requisition
+
+CSV_COLUMNS = ["ID", "Requester", "Date", "Status", "Department", "Item", "Quantity"]
+FORMATS = ["csv", "json", "xml"]
+
+
+def format_of(path, given):
+    if given:
+        return given
+    for name in FORMATS:
+        if path.endswith("." + name) or (name == "json" and path.endswith(".jsonl")):
+            return name
+    return "csv"
+
+
+def open_input(path):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def open_output(path):
+    if path in (None, "-"):
+        return contextlib.nullcontext(sys.stdout)
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def new_requisition(data):
+    """ Requisition from imported fields, filling in what a supplier sheet tends to leave out """
+    return requisition.Requisition.from_dict({
+        "ID": data.get("ID") or str(uuid.uuid4())[:8],
+        "Requester": data.get("Requester") or "",
+        "Date": data.get("Date") or datetime.now().strftime('%Y-%m-%d %H:%M'),
+        "Status": data.get("Status") or requisition.Status.PENDING.value,
+        "Department": data.get("Department") or "",
+        "Items": data.get("Items") or [],
+    })
+
+
+def read_csv(f):
+    """ The fields of each requisition in a CSV file, as given """
+    rows = csv.DictReader(f)
+    # One requisition per run of rows, so the file is never read in whole
+    for _, group in itertools.groupby(rows, key=lambda row: row.get("ID") or (row.get("Requester"), row.get("Date"))):
+        group = list(group)
+        data = dict(group[0])
+        data["Items"] = [(row["Item"], row["Quantity"]) for row in group if row.get("Item")]
+        yield data
+
+
+def read_json(f):
+    """ The fields of each requisition in a JSON lines file, as given """
+    for line_number, line in enumerate(f, start=1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise SystemExit(f"Line {line_number} is not valid JSON: {e}")
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size or None)):
+        yield batch
+
+
+def import_requisitions(args):
+    index = requisition.get_requisition_index(requisition.get_storage(args.storage))
+    # Sheets rarely keep the padding the stock export has, so compare names the way the order history does
+    stock_names = {requisition.history_key(name) for name in requisition.load_stock_items()}
+    read = read_json if format_of(args.file, args.format) == "json" else read_csv
+    added = skipped = rejected = 0
+    with open_input(args.file) as f:
+        for batch in batches(read(f), args.batch_size):
+            accepted = []
+            for data in batch:
+                req = new_requisition(data)
+                unknown = [name for name, _ in req.items if requisition.history_key(name) not in stock_names]
+                if unknown:
+                    requisition.log.warning("Requisition %s has items not in the stock list: %s", req.id,
+                                            ", ".join(unknown))
+                if not req.items or (unknown and args.strict):
+                    rejected += 1
+                elif not data.get("ID") and data.get("Date") and req.key in index.by_key:
+                    # Rows without an ID get a new one each time, so match those on Requester and the Date they
+                    # came with; rows with an ID are matched on it by add_many
+                    skipped += 1
+                else:
+                    accepted.append(req)
+            # Each batch is one journal line or one transaction, so it lands whole or not at all
+            new = index.add_many(accepted)
+            added += len(new)
+            skipped += len(accepted) - len(new)
+    print(f"Imported {added} requisitions, {skipped} already there, {rejected} rejected")
+
+
+def write_csv(f, reqs):
+    writer = csv.writer(f)
+    writer.writerow(CSV_COLUMNS)
+    for req in reqs:
+        fields = [req.id, req.requester, req.date, str(req.status), req.department]
+        for name, quantity in req.items or [("", "")]:
+            writer.writerow(fields + [name.strip(), quantity])
+        yield req
+
+
+def write_json(f, reqs):
+    for req in reqs:
+        f.write(json.dumps(req.to_dict(), ensure_ascii=False) + "\n")
+        yield req
+
+
+def write_xml(f, reqs):
+    f.write("<?xml version='1.0' encoding='utf-8'?>\n<requisitions>")
+    for req in reqs:
+        f.write(ET.tostring(requisition.requisition_to_element(req), encoding="unicode"))
+        yield req
+    f.write("</requisitions>\n")
+
+
+def filters_of(args):
+    return {"status": args.status and requisition.Status.parse(args.status), "department": args.department,
+            "date_from": args.date_from, "date_to": args.date_to}
+
+
+def export_requisitions(args):
+    storage = requisition.get_storage(args.storage)
+    writer = {"csv": write_csv, "json": write_json, "xml": write_xml}[format_of(args.output or "", args.format)]
+    matches = storage.iter_matching(text=args.text, **filters_of(args))
+    if args.archived:
+        archive_dir = getattr(storage, "archive_dir", requisition.ARCHIVE_DIR)
+        archived = requisition.search_archive(args.text, archive_dir=archive_dir, **filters_of(args))
+        exported = set()
+
+        def active(reqs):
+            for req in reqs:
+                exported.add(req.id)
+                yield req
+
+        # An archive run that lost the race to rewrite the log leaves its requisitions in both places
+        matches = itertools.chain(active(matches), (req for req in archived if req.id not in exported))
+    with open_output(args.output) as f:
+        count = sum(1 for _ in writer(f, matches))
+    print(f"Exported {count} requisitions", file=sys.stderr)
+
+
+def change_status(args):
+    index = requisition.get_requisition_index(requisition.get_storage(args.storage))
+    filters = filters_of(args)
+    if args.ids:
+        reqs = [index.by_id[req_id] for req_id in args.ids if req_id in index.by_id]
+        missing = set(args.ids) - {req.id for req in reqs}
+        if missing:
+            print(f"Not found: {', '.join(sorted(missing))}", file=sys.stderr)
+    elif any(filters.values()) or args.text:
+        reqs = [req for req in index.requisitions if requisition.requisition_matches(req, args.text, **filters)]
+    else:
+        raise SystemExit("Give --id or at least one filter, changing every requisition is not allowed")
+
+    status = requisition.Status.parse(args.new_status)
+    reqs = [req for req in reqs if req.status != status]
+    if args.dry_run:
+        for req in reqs:
+            print(f"{req.id}  {req.date}  {req.requester}  {req.department}  {req.status} -> {status}")
+        print(f"Would change {len(reqs)} requisitions")
+        return
+    changed = index.set_status_many(reqs, status)
+    print(f"Changed {len(changed)} requisitions to {status}")
+
+
+def purchase_order(args):
+    index = requisition.get_requisition_index(requisition.get_storage(args.storage))
+    lines = index.orders.purchase_order(requisition.load_stock_items(), args.by_department)
+    with open_output(args.output) as f:
+        requisition.write_purchase_order(f, lines)
+    flagged = sum(1 for line in lines if not line.in_stock)
+    print(f"{len(lines)} order lines, {flagged} not in the stock list", file=sys.stderr)
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--status", help="only requisitions with this status")
+    parser.add_argument("--department")
+    parser.add_argument("--from", dest="date_from", help="date prefix, e.g. 2024-10 or 2024-10-03")
+    parser.add_argument("--to", dest="date_to", help="date prefix, inclusive")
+    parser.add_argument("--text", help="ID, requester, department or item name containing this")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import, export and update requisitions without the window.")
+    parser.add_argument("--storage", choices=["xml", "sqlite", "service"], help="defaults to REQUISITION_STORAGE")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="add requisitions from a CSV or JSON lines file")
+    import_parser.add_argument("file", help="file to read, - for stdin")
+    import_parser.add_argument("--format", choices=["csv", "json"], help="defaults to the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=1000, help="requisitions per write, 0 for all at once")
+    import_parser.add_argument("--strict", action="store_true", help="reject requisitions with items not in stock")
+    import_parser.set_defaults(run=import_requisitions)
+
+    export_parser = commands.add_parser("export", help="write requisitions out as CSV, JSON lines or XML")
+    export_parser.add_argument("-o", "--output", help="file to write, stdout if left out")
+    export_parser.add_argument("--format", choices=FORMATS, help="defaults to the output extension, else csv")
+    export_parser.add_argument("--archived", action="store_true",
+                               help="also requisitions moved to archive/ (see REQUISITION_ARCHIVE_DAYS)")
+    add_filter_arguments(export_parser)
+    export_parser.set_defaults(run=export_requisitions)
+
+    status_parser = commands.add_parser("status", help="change the status of many requisitions in one write")
+    status_parser.add_argument("new_status", choices=[status.value for status in requisition.Status])
+    status_parser.add_argument("--id", dest="ids", action="append", help="requisition ID, can be repeated")
+    status_parser.add_argument("--dry-run", action="store_true", help="only list what would change")
+    add_filter_arguments(status_parser)
+    status_parser.set_defaults(run=change_status)
+
+    order_parser = commands.add_parser("order", help="add up every Pending item into a purchase order CSV")
+    order_parser.add_argument("-o", "--output", help="file to write, stdout if left out")
+    order_parser.add_argument("--by-department", action="store_true", help="one line per item and department")
+    order_parser.set_defaults(run=purchase_order)
+
+    args = parser.parse_args(argv)
+    requisition.configure_logging()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,358 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
+import os
+import json
+import uuid
+import sqlite3
+
+BOARD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'board.db')
+SAVE_DELAY_MS = 500  # Changes made within this long of each other are saved together
+CARD_HEIGHT = 110  # Pixels per card frame; the tab only gets as many frames as fit
+CARD_WIDTH = 420
+VISIBLE_CARDS = 5  # Cards shown before the window is resized
+
+def new_id():
+    return uuid.uuid4().hex[:8]
 
 class Card:
-    def __init__(self, title, description, due_date=None):
+    def __init__(self, title, description, due_date=None, id=None):
+        self.id = id or new_id()
         self.title = title
         self.description = description
         self.due_date = due_date
         self.comments = []
+        self.list_id = None
+        self.position = 0.0
+        self.prev = None  # Neighbours in its list
+        self.next = None
 
 class List:
-    def __init__(self, name):
+    """ Cards by ID, kept in order by linking each card to its neighbours, so a card
+    can be put anywhere or taken out without shifting the others """
+
+    def __init__(self, name, id=None):
+        self.id = id or new_id()
         self.name = name
-        self.cards = []
+        self.position = 0.0
+        self.cards = {}  # id -> Card
+        self.first = None
+        self.last = None
+        self.order = None  # Cards in order, made again when asked for after a change
+
+    def add_card(self, card, before=None):
+        """ Link card in ahead of before, or at the end """
+        after = before.prev if before is not None else self.last
+        card.prev, card.next = after, before
+        if after is None:
+            self.first = card
+        else:
+            after.next = card
+        if before is None:
+            self.last = card
+        else:
+            before.prev = card
+        self.cards[card.id] = card
+        self.order = None
+
+    def remove_card(self, card):
+        if card.prev is None:
+            self.first = card.next
+        else:
+            card.prev.next = card.next
+        if card.next is None:
+            self.last = card.prev
+        else:
+            card.next.prev = card.prev
+        card.prev = card.next = None
+        del self.cards[card.id]
+        self.order = None
 
-    def add_card(self, card):
-        self.cards.append(card)
+    def ordered(self):
+        if self.order is None:
+            self.order = []
+            card = self.first
+            while card is not None:
+                self.order.append(card)
+                card = card.next
+        return self.order
 
 class Board:
+    """ Lists and cards by ID, remembering which ones changed since the last save.
+
+    Change lists and cards through the Board methods so they get marked dirty;
+    BoardStore.save then writes only those.
+    """
+
     def __init__(self, name):
         self.name = name
-        self.lists = []
+        self.lists = {}  # id -> List, in tab order
+        self.cards = {}  # id -> Card, across all lists
+        self.dirty_lists = set()
+        self.dirty_cards = set()
+        self.deleted_cards = set()
+
+    def is_dirty(self):
+        return bool(self.dirty_lists or self.dirty_cards or self.deleted_cards)
 
     def add_list(self, list):
-        self.lists.append(list)
+        if self.lists:
+            list.position = next(reversed(self.lists.values())).position + 1
+        self.lists[list.id] = list
+        for card in list.cards.values():
+            self.cards[card.id] = card
+        self.dirty_lists.add(list.id)
+
+    def add_card(self, list_id, card):
+        list = self.lists[list_id]
+        card.list_id = list_id
+        list.add_card(card)
+        self.cards[card.id] = card
+        self.place(list, card)
+        self.dirty_cards.add(card.id)
+
+    def move_card(self, card_id, list_id, before_id=None):
+        """ Move a card into list_id ahead of before_id, or to its end; only the moved card needs saving """
+        card = self.cards[card_id]
+        if before_id == card_id:
+            return
+        self.lists[card.list_id].remove_card(card)
+        list = self.lists[list_id]
+        card.list_id = list_id
+        list.add_card(card, self.cards[before_id] if before_id else None)
+        self.place(list, card)
+        self.dirty_cards.add(card_id)
+
+    def place(self, list, card):
+        """ Position card between its neighbours, so saving it keeps the order without touching them """
+        before, after = card.prev, card.next
+        if before is None and after is None:
+            card.position = 1.0
+        elif after is None:
+            card.position = before.position + 1
+        elif before is None:
+            card.position = after.position - 1
+        else:
+            card.position = (before.position + after.position) / 2
+            if not before.position < card.position < after.position:
+                # Halved too often at the same spot to tell apart, number the whole list again
+                for number, other in enumerate(list.ordered(), start=1):
+                    other.position = float(number)
+                    self.dirty_cards.add(other.id)
+
+    def update_card(self, card_id, **fields):
+        card = self.cards[card_id]
+        for name, value in fields.items():
+            setattr(card, name, value)
+        self.dirty_cards.add(card_id)
+
+    def comment_card(self, card_id, comment):
+        self.cards[card_id].comments.append(comment)
+        self.dirty_cards.add(card_id)
+
+    def delete_card(self, card_id):
+        card = self.cards.pop(card_id)
+        self.lists[card.list_id].remove_card(card)
+        self.dirty_cards.discard(card_id)
+        self.deleted_cards.add(card_id)
+
+class BoardStore:
+    """ A board kept in SQLite, one row per list and per card, so a save only writes what changed """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or BOARD_FILE
+        self.connection = sqlite3.connect(self.db_path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS lists (id TEXT PRIMARY KEY, name TEXT NOT NULL, position REAL NOT NULL)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cards (id TEXT PRIMARY KEY, list_id TEXT NOT NULL, title TEXT NOT NULL, "
+                "description TEXT NOT NULL, due_date TEXT, comments TEXT NOT NULL, position REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS cards_by_list ON cards (list_id, position)")
+
+    def load(self, name="My Board"):
+        board = Board(name)
+        for list_id, list_name, position in self.connection.execute(
+                "SELECT id, name, position FROM lists ORDER BY position"):
+            list = List(list_name, list_id)
+            list.position = position
+            board.lists[list_id] = list
+        rows = self.connection.execute(
+            "SELECT id, list_id, title, description, due_date, comments, position FROM cards ORDER BY list_id, position")
+        for card_id, list_id, title, description, due_date, comments, position in rows:
+            if list_id not in board.lists:
+                continue  # Left behind by a list that is gone
+            card = Card(title, description, due_date, card_id)
+            card.comments = json.loads(comments)
+            card.list_id = list_id
+            card.position = position
+            board.lists[list_id].add_card(card)
+            board.cards[card_id] = card
+        return board
+
+    def save(self, board):
+        """ Write the lists and cards changed since the last save in one transaction, returning how many """
+        lists = [board.lists[list_id] for list_id in board.dirty_lists if list_id in board.lists]
+        cards = [board.cards[card_id] for card_id in board.dirty_cards if card_id in board.cards]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lists (id, name, position) VALUES (?, ?, ?)",
+                [(list.id, list.name, list.position) for list in lists])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO cards (id, list_id, title, description, due_date, comments, position) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(card.id, card.list_id, card.title, card.description, card.due_date,
+                  json.dumps(card.comments, ensure_ascii=False), card.position) for card in cards])
+            self.connection.executemany("DELETE FROM cards WHERE id = ?", [(card_id,) for card_id in board.deleted_cards])
+        written = len(lists) + len(cards) + len(board.deleted_cards)
+        board.dirty_lists.clear()
+        board.dirty_cards.clear()
+        board.deleted_cards.clear()
+        return written
+
+    def close(self):
+        self.connection.close()
+
+class CardListView:
+    """ The cards of one list, drawn into a fixed pool of card frames.
+
+    Only as many frames as fit in the tab are made; scrolling and moves write
+    other cards into the same frames, so a list of thousands of cards costs no
+    more to show than a list of ten.
+    """
+
+    def __init__(self, parent, app, list):
+        self.app = app
+        self.list = list
+        self.offset = 0
+        self.visible_count = 0
+        self.slots = []  # (frame, title, description, due) per visible card
+        self.dragged = None
+
+        self.frame = tk.Frame(parent)
+        self.frame.pack(fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Sized by the window, not by the frames packed into it
+        self.cards_frame = tk.Frame(self.frame, width=CARD_WIDTH, height=CARD_HEIGHT * VISIBLE_CARDS)
+        self.cards_frame.pack_propagate(False)
+        self.cards_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.cards_frame.bind('<Configure>', self.on_resize)
+        self.bind_scrolling(self.cards_frame)
+
+    def bind_scrolling(self, widget):
+        widget.bind('<MouseWheel>', self.on_mousewheel)
+        widget.bind('<Button-4>', self.on_mousewheel)
+        widget.bind('<Button-5>', self.on_mousewheel)
+
+    def add_slot(self):
+        slot = len(self.slots)
+        frame = tk.Frame(self.cards_frame, height=CARD_HEIGHT, bd=1, relief=tk.RIDGE)
+        frame.pack_propagate(False)
+        title = tk.Label(frame, font=("TkDefaultFont", 10, "bold"))
+        description = tk.Label(frame)
+        due = tk.Label(frame)
+        buttons = tk.Frame(frame)
+        for text, command in (("Comment", self.app.comment_card), ("Edit", self.app.edit_card),
+                              ("Move", self.app.choose_move), ("Delete", self.app.delete_card)):
+            tk.Button(buttons, text=text,
+                      command=lambda command=command: command(self.card_at(slot))).pack(side=tk.LEFT)
+        for widget in (title, description, due):
+            widget.pack()
+        buttons.pack(side=tk.BOTTOM)
+        # Cards are dragged by their frame or text, the buttons keep their clicks
+        for widget in (frame, title, description, due):
+            widget.card_slot = slot
+            widget.bind('<ButtonPress-1>', self.on_press)
+            widget.bind('<B1-Motion>', self.on_motion)
+            widget.bind('<ButtonRelease-1>', self.on_release)
+            self.bind_scrolling(widget)
+        self.slots.append((frame, title, description, due))
+
+    def card_at(self, slot):
+        cards = self.list.ordered()
+        position = self.offset + slot
+        return cards[position] if position < len(cards) else None
+
+    def max_offset(self):
+        return max(0, len(self.list.cards) - self.visible_count)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.max_offset()))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def on_scrollbar(self, action, value, units=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * len(self.list.cards))
+        elif action == "scroll":
+            step = self.visible_count if units == "pages" else 1
+            self.scroll_to(self.offset + int(value) * step)
+
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - 1)
+        else:
+            self.scroll_to(self.offset + 1)
+        return "break"
+
+    def on_resize(self, event):
+        visible_count = max(1, event.height // CARD_HEIGHT)
+        if visible_count != self.visible_count:
+            self.visible_count = visible_count
+            self.render()
+
+    def render(self):
+        self.offset = min(self.offset, self.max_offset())
+        while len(self.slots) < self.visible_count:
+            self.add_slot()
+        for slot, (frame, title, description, due) in enumerate(self.slots):
+            card = self.card_at(slot) if slot < self.visible_count else None
+            if card is None:
+                frame.pack_forget()
+                continue
+            title.config(text=card.title)
+            description.config(text=card.description)
+            due.config(text=f"Due: {card.due_date}" if card.due_date else "")
+            frame.pack(fill=tk.X)
+
+        total = len(self.list.cards)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_count) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_press(self, event):
+        self.dragged = self.card_at(event.widget.card_slot)
+
+    def on_motion(self, event):
+        if self.dragged is not None:
+            self.app.root.config(cursor="fleur")
+
+    def on_release(self, event):
+        card, self.dragged = self.dragged, None
+        self.app.root.config(cursor="")
+        if card is not None:
+            self.app.drop_card(card, event.x_root, event.y_root)
+
+    def slot_of(self, widget):
+        while widget is not None and not hasattr(widget, 'card_slot'):
+            widget = widget.master
+        return None if widget is None else widget.card_slot
 
 class TrelloApp:
-    def __init__(self, root):
+    def __init__(self, root, store=None):
         self.root = root
         self.root.title("Offline Trello")
-        self.board = Board("My Board")
+        self.store = store or BoardStore()
+        self.board = self.store.load("My Board")
+        self.tabs = {}  # notebook tab -> list id
+        self.view = None  # Only the selected tab has card widgets
+        self.save_job = None
 
         self.notebook = ttk.Notebook(self.root)
-        self.notebook.pack(pady=10, expand=True)
+        self.notebook.pack(pady=10, fill=tk.BOTH, expand=True)
+        self.notebook.bind('<<NotebookTabChanged>>', self.show_tab)
 
         self.lists_frame = tk.Frame(self.root)
         self.lists_frame.pack(pady=10)
@@ -42,60 +363,132 @@ class TrelloApp:
         self.add_card_button = tk.Button(self.lists_frame, text="Add Card", command=self.add_card)
         self.add_card_button.pack(side=tk.LEFT)
 
+        for list in self.board.lists.values():
+            self.add_tab(list)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.save()
+        self.store.close()
+        self.root.destroy()
+
+    def schedule_save(self):
+        # One save for a burst of edits, and only of the cards they touched
+        if self.save_job is None:
+            self.save_job = self.root.after(SAVE_DELAY_MS, self.save)
+
+    def save(self):
+        if self.save_job is not None:
+            self.root.after_cancel(self.save_job)
+            self.save_job = None
+        if self.board.is_dirty():
+            self.store.save(self.board)
+
+    def add_tab(self, list):
+        # Empty until selected, show_tab fills it
+        tab = tk.Frame(self.notebook)
+        self.notebook.add(tab, text=list.name)
+        self.tabs[str(tab)] = list.id
+
+    def show_tab(self, event=None):
+        if self.view is not None:
+            self.view.frame.destroy()
+            self.view = None
+        tab = self.notebook.select()
+        if tab in self.tabs:
+            self.view = CardListView(self.notebook.nametowidget(tab), self, self.board.lists[self.tabs[tab]])
+
+    def redraw(self):
+        if self.view is not None:
+            self.view.render()
+
     def add_list(self):
         list_name = simpledialog.askstring("Add List", "Enter list name")
         if list_name:
             new_list = List(list_name)
             self.board.add_list(new_list)
-            self.notebook.add(tk.Frame(self.notebook), text=list_name)
+            self.add_tab(new_list)
+            self.schedule_save()
 
     def add_card(self):
-        list_index = self.notebook.index(self.notebook.select())
-        list_name = self.notebook.tab(list_index, "text")
-        for list in self.board.lists:
-            if list.name == list_name:
-                card_title = simpledialog.askstring("Add Card", "Enter card title")
-                card_description = simpledialog.askstring("Add Card", "Enter card description")
-                due_date = simpledialog.askstring("Add Card", "Enter due date (optional)")
-                if card_title and card_description:
-                    new_card = Card(card_title, card_description, due_date)
-                    list.add_card(new_card)
-                    card_frame = tk.Frame(self.notebook.select())
-                    card_frame.pack(fill=tk.BOTH, expand=True)
-                    tk.Label(card_frame, text=card_title).pack()
-                    tk.Label(card_frame, text=card_description).pack()
-                    if due_date:
-                        tk.Label(card_frame, text=f"Due: {due_date}").pack()
-                    comment_button = tk.Button(card_frame, text="Comment", command=lambda: self.comment_card(new_card))
-                    comment_button.pack()
-                    edit_button = tk.Button(card_frame, text="Edit", command=lambda: self.edit_card(new_card))
-                    edit_button.pack()
-                    delete_button = tk.Button(card_frame, text="Delete", command=lambda: self.delete_card(new_card))
-                    delete_button.pack()
+        list_id = self.tabs.get(self.notebook.select())
+        if list_id is None:
+            return
+        card_title = simpledialog.askstring("Add Card", "Enter card title")
+        card_description = simpledialog.askstring("Add Card", "Enter card description")
+        due_date = simpledialog.askstring("Add Card", "Enter due date (optional)")
+        if card_title and card_description:
+            new_card = Card(card_title, card_description, due_date)
+            self.board.add_card(list_id, new_card)
+            self.redraw()
+            self.schedule_save()
+
+    def move_card(self, card, list_id, before=None):
+        self.board.move_card(card.id, list_id, before.id if before is not None else None)
+        self.redraw()
+        self.schedule_save()
+
+    def choose_move(self, card):
+        menu = tk.Menu(self.root, tearoff=0)
+        for list in self.board.lists.values():
+            if list.id != card.list_id:
+                menu.add_command(label=f"Move to {list.name}", command=lambda list_id=list.id: self.move_card(card, list_id))
+        current = self.board.lists[card.list_id]
+        menu.add_separator()
+        menu.add_command(label="Move to top", command=lambda: self.move_card(card, card.list_id, current.first))
+        menu.add_command(label="Move to bottom", command=lambda: self.move_card(card, card.list_id))
+        menu.tk_popup(self.root.winfo_pointerx(), self.root.winfo_pointery())
+
+    def drop_card(self, card, x_root, y_root):
+        """ Dropped on a tab: move to the end of that list. Dropped on a card: take its place. """
+        widget = self.root.winfo_containing(x_root, y_root)
+        if widget is self.notebook:
+            x, y = x_root - self.notebook.winfo_rootx(), y_root - self.notebook.winfo_rooty()
+            try:
+                index = self.notebook.index(f"@{x},{y}")
+            except tk.TclError:
+                return  # Not over a tab
+            if not 0 <= index < len(self.notebook.tabs()):
+                return
+            list_id = self.tabs[self.notebook.tabs()[index]]
+            if list_id != card.list_id:
+                self.move_card(card, list_id)
+            return
+        if self.view is None:
+            return
+        slot = self.view.slot_of(widget)
+        target = None if slot is None else self.view.card_at(slot)
+        if target is None or target is card:
+            return
+        # Dragged down it goes below the card it was dropped on, dragged up it goes above
+        before = target.next if target.position > card.position else target
+        self.move_card(card, card.list_id, before)
 
     def comment_card(self, card):
         comment = simpledialog.askstring("Comment", "Enter comment")
         if comment:
-            card.comments.append(comment)
+            self.board.comment_card(card.id, comment)
+            self.schedule_save()
             messagebox.showinfo("Comment Added", "Comment added successfully")
 
     def edit_card(self, card):
         new_title = simpledialog.askstring("Edit Card", "Enter new title")
         new_description = simpledialog.askstring("Edit Card", "Enter new description")
         if new_title and new_description:
-            card.title = new_title
-            card.description = new_description
+            self.board.update_card(card.id, title=new_title, description=new_description)
+            self.redraw()
+            self.schedule_save()
             messagebox.showinfo("Card Edited", "Card edited successfully")
 
     def delete_card(self, card):
         confirm = messagebox.askyesno("Delete Card", "Are you sure you want to delete this card?")
         if confirm:
-            for list in self.board.lists:
-                if card in list.cards:
-                    list.cards.remove(card)
-                    messagebox.showinfo("Card Deleted", "Card deleted successfully")
+            self.board.delete_card(card.id)
+            self.redraw()
+            self.schedule_save()
+            messagebox.showinfo("Card Deleted", "Card deleted successfully")
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = TrelloApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
@@ -1,12 +1,35 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import xml.etree.ElementTree as ET
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import csv
 import sys
-import chardet
 import uuid
+import json
+import bisect
+import heapq
+import itertools
+import io
+import hashlib
+import sqlite3
+import threading
+import queue
+import re
+import logging
+import time
+import atexit
+import contextlib
+import functools
+from dataclasses import dataclass, field, replace
+from enum import Enum
+from typing import NamedTuple
+import tempfile
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 
 def resource_path(relative_path):
@@ -20,7 +43,194 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 LOG_DATA_FILE = resource_path(os.path.join(os.path.dirname(__file__), 'log_data.xml'))
+JOURNAL_FILE = resource_path(os.path.join(os.path.dirname(__file__), 'log_data.journal'))
 DEPARTMENT_FILE = resource_path(os.path.join(os.path.dirname(__file__), 'department.csv'))
+DATABASE_FILE = resource_path(os.path.join(os.path.dirname(__file__), 'requisitions.db'))
+ARCHIVE_DIR = resource_path(os.path.join(os.path.dirname(__file__), 'archive'))
+
+# 'xml' keeps using log_data.xml, 'sqlite' switches to requisitions.db (migrated from the XML on first use)
+STORAGE_BACKEND = os.environ.get('REQUISITION_STORAGE', 'xml')
+# 'service' talks to the requisition server (server.py) at this address instead of opening the files
+SERVER_URL = os.environ.get('REQUISITION_SERVER', 'http://127.0.0.1:8765')
+# Completed requisitions older than this move out of log_data.xml into archive/requisitions-YYYY-MM.xml.
+# Off unless set: archived requisitions no longer show in the window, only in cli.py export --archived
+ARCHIVE_AFTER_DAYS = int(os.environ.get('REQUISITION_ARCHIVE_DAYS', '0'))
+IO_POLL_MS = 50  # How often the window picks up results from the background I/O thread
+# How often the main window checks for requisitions saved by other stations, 0 turns it off
+REFRESH_MS = int(float(os.environ.get('REQUISITION_REFRESH_SECONDS', '2')) * 1000)
+FINGERPRINT_BLOCK = 4096  # Bytes hashed from each end of a file to tell a rewrite from an append
+LOCK_TIMEOUT = 10  # Seconds to wait for another station to finish writing before giving up
+
+STOCK_SEARCH_LIMIT = 50  # Most items shown in an item dropdown
+SEARCH_DEBOUNCE_MS = 150  # Wait this long after the last key before filtering
+STOCK_CACHE_VERSION = 2
+WARM_START_VERSION = 2
+ENCODING_SAMPLE_SIZE = 64 * 1024  # Bytes handed to chardet when the catalogue is not UTF-8
+
+# DEBUG also logs every timing span as it finishes
+LOG_LEVEL = os.environ.get('REQUISITION_LOG_LEVEL', 'WARNING').upper()
+# File to write the timing report to when the app exits, '-' for stderr
+METRICS_REPORT = os.environ.get('REQUISITION_METRICS')
+
+log = logging.getLogger("requisition")
+
+
+class Metrics:
+    """ Timing spans and counters for the data path and the UI.
+
+    Spans are named after the stage they cover (load.parse, index.build,
+    ui.render, storage.write, ...) and keep a call count, total and worst time.
+    Both the Tk thread and the I/O worker record into the same instance.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+            log.debug("%s took %.2f ms", name, elapsed * 1000)
+
+    def timed(self, name):
+        """ Decorator form of span() for whole functions """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'spans': {name: {'calls': calls, 'total_seconds': total, 'max_seconds': worst}
+                          for name, (calls, total, worst) in self.spans.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self):
+        data = self.snapshot()
+        lines = [f"{'span':<24} {'calls':>7} {'total ms':>11} {'max ms':>10}"]
+        for name, stats in sorted(data['spans'].items(), key=lambda item: -item[1]['total_seconds']):
+            lines.append(f"{name:<24} {stats['calls']:>7} {stats['total_seconds'] * 1000:>11.1f} "
+                         f"{stats['max_seconds'] * 1000:>10.1f}")
+        lines.append("")
+        lines.append(f"{'counter':<24} {'value':>7}")
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f"{name:<24} {value:>7}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
+
+
+def write_metrics_report(destination=None):
+    destination = destination or METRICS_REPORT
+    if destination == '-':
+        sys.stderr.write(metrics.report() + "\n")
+    elif destination:
+        with open(destination, 'w', encoding='utf-8') as f:
+            f.write(metrics.report() + "\n")
+
+
+def configure_logging():
+    logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(threadName)s: %(message)s")
+    if METRICS_REPORT:
+        atexit.register(write_metrics_report)
+
+class Status(str, Enum):
+    PENDING = 'Pending'
+    COMPLETED = 'Completed'
+
+    __str__ = str.__str__
+
+    @classmethod
+    def parse(cls, value):
+        try:
+            return cls(value)
+        except ValueError:
+            return intern_text(value)  # Something hand-edited into the log, keep it as it is
+
+
+class LineItem(NamedTuple):
+    """ One line of a requisition. quantity is an int unless someone typed something like '2 boxes' """
+    name: str
+    quantity: object
+
+
+def intern_text(value):
+    # The same item, department and requester names repeat across thousands of requisitions
+    return sys.intern(value) if value else ''
+
+
+def parse_quantity(text):
+    text = (text or '').strip()
+    return int(text) if text.isdigit() else intern_text(text)
+
+
+def make_line_item(name, quantity):
+    return LineItem(intern_text(name), quantity if isinstance(quantity, int) else parse_quantity(quantity))
+
+
+@dataclass(slots=True, eq=False)
+class Requisition:
+    id: str
+    requester: str
+    date: str
+    status: str
+    department: str = ''
+    items: object = ()  # list of LineItem, or LazyItems straight out of the XML
+    version: int = 0  # Goes up with every status change, so stations can tell whose change came first
+
+    @property
+    def key(self):
+        # Records written before IDs existed are matched on Requester and Date
+        return (self.requester, self.date)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            id=data.get('ID') or str(uuid.uuid4())[:8],
+            requester=intern_text(data.get('Requester')),
+            date=data.get('Date') or '',
+            status=Status.parse(data.get('Status')),
+            department=intern_text(data.get('Department')),
+            items=[make_line_item(name, quantity) for name, quantity in data.get('Items', ())],
+            version=int(data.get('Version') or 0),
+        )
+
+    def to_dict(self):
+        data = {
+            'ID': self.id,
+            'Requester': self.requester,
+            'Date': self.date,
+            'Status': str(self.status),
+            'Department': self.department,
+            'Items': [[name, quantity] for name, quantity in self.items],
+        }
+        if self.version:
+            data['Version'] = self.version
+        return data
+
+    def copy(self, **changes):
+        return replace(self, **changes)
+
 
 class BaseWindow:
     def __init__(self, title, master=None):
@@ -60,12 +270,211 @@ class BaseWindow:
     def run(self):
         self.root.mainloop()
 
+def summarize_items(items):
+    return ", ".join(f"{name.strip()} x{qty}" for name, qty in items)
+
+
+class VirtualRequisitionList:
+    """ Requisition list that only keeps Treeview rows for the part that is on screen.
+
+    The Treeview holds a fixed pool of rows, one per visible line, and scrolling
+    just writes the next slice of requisitions into them, so the widget count
+    depends on the window height and not on how many requisitions there are.
+    """
+    ROW_HEIGHT = 22
+    COLUMNS = (
+        ("requester", "ID - Requester", 200),
+        ("department", "Department", 130),
+        ("date", "Date", 120),
+        ("items", "Items", 300),
+        ("status", "Status", 80),
+    )
+    STATUS_COLUMN = "#5"
+
+    def __init__(self, parent, title, on_status_click):
+        self.frame = tk.LabelFrame(parent, text=title)
+        self.on_status_click = on_status_click
+        self.rows = []
+        self.offset = 0
+        self.visible_count = 0
+        self.slots = []
+        self.selection = {}  # id(req) -> req, kept here because the Treeview rows get reused
+        self.focused = None
+        self.rendering = False
+
+        style = ttk.Style(self.frame)
+        style.configure("Requisitions.Treeview", rowheight=self.ROW_HEIGHT)
+
+        list_frame = tk.Frame(self.frame)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.tree = ttk.Treeview(list_frame, columns=[name for name, _, _ in self.COLUMNS],
+                                 show="headings", selectmode="extended", style="Requisitions.Treeview")
+        for name, heading, width in self.COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, anchor="w", stretch=(name == "items"))
+        self.tree.tag_configure("Pending", foreground="red")
+        self.tree.tag_configure("Completed", foreground="green")
+
+        self.scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree.bind('<Configure>', self.on_resize)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', self.on_mousewheel)
+        self.tree.bind('<Button-5>', self.on_mousewheel)
+        self.tree.bind('<Button-1>', self.on_click)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Control-a>', self.select_all)
+
+        # Items of the selected requisition
+        self.items_view = ttk.Treeview(self.frame, columns=("item", "qty"), show="headings", height=5)
+        self.items_view.heading("item", text="Item")
+        self.items_view.heading("qty", text="Qty")
+        self.items_view.column("item", width=300, anchor="w")
+        self.items_view.column("qty", width=80, anchor="w")
+        self.items_view.pack(fill=tk.X)
+
+    def set_rows(self, rows):
+        self.rows = rows
+        if self.selection:
+            kept = {id(row) for row in rows}
+            self.selection = {key: req for key, req in self.selection.items() if key in kept}
+        self.offset = min(self.offset, self.max_offset())
+        self.render()
+
+    def add_row(self, req):
+        bisect.insort(self.rows, req, key=lambda row: row.date)
+        self.render()
+
+    def remove_row(self, req):
+        for position, row in enumerate(self.rows):
+            if row is req:
+                del self.rows[position]
+                break
+        self.selection.pop(id(req), None)
+        self.offset = min(self.offset, self.max_offset())
+        self.render()
+
+    def max_offset(self):
+        return max(0, len(self.rows) - self.visible_count)
+
+    def scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.max_offset()))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def on_scrollbar(self, action, value, units=None):
+        if action == "moveto":
+            self.scroll_to(float(value) * len(self.rows))
+        elif action == "scroll":
+            step = self.visible_count if units == "pages" else 1
+            self.scroll_to(self.offset + int(value) * step)
+
+    def on_mousewheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.offset - 3)
+        else:
+            self.scroll_to(self.offset + 3)
+        return "break"
+
+    def on_resize(self, event):
+        # One row's worth of height goes to the column headings
+        visible_count = max(1, event.height // self.ROW_HEIGHT - 1)
+        if visible_count != self.visible_count:
+            self.visible_count = visible_count
+            self.offset = min(self.offset, self.max_offset())
+            self.render()
+
+    def render(self):
+        with metrics.span('ui.render'):
+            self.render_rows()
+
+    def render_rows(self):
+        self.rendering = True
+        for slot in range(len(self.slots), self.visible_count):
+            self.slots.append(self.tree.insert('', 'end', iid=f"row{slot}"))
+            metrics.count('widgets.rows_created')
+
+        selected_slots = []
+        for slot, iid in enumerate(self.slots):
+            position = self.offset + slot
+            if slot >= self.visible_count or position >= len(self.rows):
+                self.tree.detach(iid)
+                continue
+            self.tree.move(iid, '', slot)
+            metrics.count('widgets.rows_rendered')
+            req = self.rows[position]
+            self.tree.item(iid, values=(f"{req.id} - {req.requester}", req.department, req.date,
+                                        summarize_items(req.items), str(req.status)), tags=(str(req.status),))
+            if id(req) in self.selection:
+                selected_slots.append(iid)
+
+        if set(selected_slots) != set(self.tree.selection()):
+            self.tree.selection_set(selected_slots)
+        self.rendering = False
+
+        total = len(self.rows)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_count) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def requisition_at(self, iid):
+        if iid not in self.slots:
+            return None
+        position = self.offset + self.slots.index(iid)
+        return self.rows[position] if position < len(self.rows) else None
+
+    def on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "cell":
+            return
+        if self.tree.identify_column(event.x) != self.STATUS_COLUMN:
+            return
+        req = self.requisition_at(self.tree.identify_row(event.y))
+        if req is not None:
+            self.on_status_click(req)
+
+    def on_select(self, event=None):
+        if self.rendering:
+            return
+        # The Treeview only knows about the rows on screen, the rest keep their selection
+        selected = set(self.tree.selection())
+        for iid in self.slots:
+            req = self.requisition_at(iid)
+            if req is None:
+                continue
+            if iid in selected:
+                self.selection[id(req)] = req
+            else:
+                self.selection.pop(id(req), None)
+
+        req = self.requisition_at(self.tree.focus())
+        if req is not None and req is not self.focused:
+            self.focused = req
+            self.items_view.delete(*self.items_view.get_children())
+            for item, qty in req.items:
+                self.items_view.insert('', 'end', values=(item, qty))
+
+    def select_all(self, event=None):
+        self.selection = {id(req): req for req in self.rows}
+        self.render()
+        return "break"
+
+    def selected_requisitions(self):
+        return list(self.selection.values())
+
+
 class RequisitionWindow(BaseWindow):
-    def __init__(self, stock_items, departments, master=None):
+    def __init__(self, stock_items, departments, master=None, history=None):
         super().__init__("New Requisition", master)
-        self.stock_items = stock_items
+        self.stock_items = stock_items if isinstance(stock_items, StockCatalogue) else StockCatalogue(stock_items)
         self.departments = departments
+        self.history = history if history is not None else get_requisition_index(validate=False).history
         self.item_rows = []
+        self.search_jobs = {}
         self.create_widgets()
 
     def update_department_combobox(self, event, combobox):
@@ -117,7 +526,7 @@ class RequisitionWindow(BaseWindow):
         row_frame.pack(fill=tk.X, pady=5)
 
         stock_var = tk.StringVar(self.root)
-        stock_combobox = ttk.Combobox(row_frame, textvariable=stock_var, values=self.stock_items)
+        stock_combobox = ttk.Combobox(row_frame, textvariable=stock_var, values=self.stock_items.search('') + ["Other"])
         stock_combobox.pack(side=tk.LEFT)
         stock_combobox.focus_set()
 
@@ -127,7 +536,12 @@ class RequisitionWindow(BaseWindow):
         remove_button = tk.Button(row_frame, text="-", command=lambda: self.remove_item_row(row_frame))
         remove_button.pack(side=tk.LEFT)
 
-        stock_combobox.bind('<KeyRelease>', lambda event: self.update_combobox(event, stock_combobox))
+        hint_label = tk.Label(row_frame, fg="grey")
+        hint_label.pack(side=tk.LEFT, padx=5)
+
+        stock_combobox.bind('<KeyRelease>', lambda event: self.schedule_combobox_update(event, stock_combobox))
+        stock_combobox.bind('<<ComboboxSelected>>', lambda event: self.show_history_hint(stock_var, hint_label))
+        stock_combobox.bind('<FocusOut>', lambda event: self.show_history_hint(stock_var, hint_label))
 
         self.item_rows.append((stock_var, quantity_entry))
 
@@ -136,11 +550,29 @@ class RequisitionWindow(BaseWindow):
         self.item_rows = [(stock_var, quantity_entry) for stock_var, quantity_entry in self.item_rows
                           if stock_var.winfo_exists()]
 
+    def schedule_combobox_update(self, event, combobox):
+        # Only filter once typing pauses, not on every key
+        job = self.search_jobs.pop(str(combobox), None)
+        if job:
+            self.root.after_cancel(job)
+        self.search_jobs[str(combobox)] = self.root.after(SEARCH_DEBOUNCE_MS, lambda: self.update_combobox(event, combobox))
+
     def update_combobox(self, event, combobox):
+        self.search_jobs.pop(str(combobox), None)
+        if not combobox.winfo_exists():
+            return  # The row was removed while we were waiting
         current_text = combobox.get().lower()
-        filtered_items = [item for item in self.stock_items + ["Other"] if current_text in item.lower()]
+        filtered_items = self.stock_items.search(current_text)
+        if current_text in "other":
+            filtered_items.append("Other")
         combobox['values'] = filtered_items
 
+    def show_history_hint(self, stock_var, hint_label):
+        # What this department ordered last time, or anyone if it never ordered the item
+        item = stock_var.get()
+        entry = self.history.last_ordered(item, self.department_var.get()) or self.history.last_ordered(item)
+        hint_label.config(text=entry.describe() if entry else "")
+
     def submit_requisition(self):
         requester = self.requester_entry.get()
         request_date = datetime.now().strftime('%Y-%m-%d %H:%M')
@@ -158,32 +590,101 @@ class RequisitionWindow(BaseWindow):
                 item = simpledialog.askstring("Custom Item", "Enter the item name:")
 
             if item and quantity:
-                items.append((item, quantity))
+                items.append(make_line_item(item, quantity))
 
         if not items:
             messagebox.showwarning("Input Error", "Please add at least one item to the requisition.")
             return
 
-        requisition = {
-            "ID": str(uuid.uuid4())[:8],
-            "Requester": requester,
-            "Date": request_date,
-            "Status": "Pending",
-            "Department": self.department_var.get(),
-            "Items": items
-        }
+        requisition = Requisition(
+            id=str(uuid.uuid4())[:8],
+            requester=intern_text(requester),
+            date=request_date,
+            status=Status.PENDING,
+            department=intern_text(self.department_var.get()),
+            items=items,
+        )
         if save_to_xml(requisition):
             messagebox.showinfo("Success", "Requisition logged successfully!")
             self.root.destroy()
         else:
             messagebox.showerror("Error", "Failed to save requisition. Please try again.")
 
+class PurchaseOrderWindow(BaseWindow):
+    """ Everything Pending added up per item, redrawn whenever the requisitions change """
+
+    def __init__(self, index, stock_items, master=None):
+        super().__init__("Purchase Order", master)
+        self.index = index
+        self.stock_items = stock_items
+        self.by_department = tk.BooleanVar(self.root, value=False)
+        self.create_widgets()
+        self.index.subscribe(self.on_requisitions_changed)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.display_lines()
+
+    def create_widgets(self):
+        toolbar = tk.Frame(self.frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=10)
+        tk.Checkbutton(toolbar, text="Per department", variable=self.by_department,
+                       command=self.display_lines).pack(side=tk.LEFT)
+        tk.Button(toolbar, text="Export CSV", command=self.export).pack(side=tk.LEFT, padx=5)
+        self.summary_label = tk.Label(toolbar)
+        self.summary_label.pack(side=tk.RIGHT)
+
+        self.tree = ttk.Treeview(self.frame, columns=PURCHASE_ORDER_COLUMNS, show="headings")
+        for column in PURCHASE_ORDER_COLUMNS:
+            self.tree.heading(column, text=column)
+        self.tree.tag_configure("flagged", foreground="red")
+        scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def purchase_order(self):
+        return self.index.orders.purchase_order(self.stock_items, self.by_department.get())
+
+    def display_lines(self):
+        lines = self.purchase_order()
+        self.tree.delete(*self.tree.get_children())
+        for line, row in zip(lines, purchase_order_rows(lines)):
+            self.tree.insert("", tk.END, values=row, tags=("flagged",) if not line.in_stock else ())
+        flagged = sum(1 for line in lines if not line.in_stock)
+        self.summary_label.config(text=f"{len(lines)} lines, {flagged} not in the stock list")
+
+    def on_requisitions_changed(self, event, req=None, old_status=None):
+        if event != 'conflict':
+            self.display_lines()
+
+    def export(self):
+        path = filedialog.asksaveasfilename(parent=self.root, defaultextension=".csv",
+                                            initialfile=f"purchase-order-{datetime.now():%Y-%m-%d}.csv",
+                                            filetypes=[("CSV files", "*.csv")])
+        if path:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                write_purchase_order(f, self.purchase_order())
+
+    def close(self):
+        self.index.unsubscribe(self.on_requisitions_changed)
+        self.root.destroy()
+
+
 class MainMenu(BaseWindow):
-    def __init__(self, stock_items):
+    def __init__(self, stock_items=None):
         super().__init__("Requisition and Stock Management")
-        self.stock_items = stock_items
+        self.stock_items = stock_items  # None until the worker has read the catalogue
         self.requisitions = self.load_requisitions()
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.bind('<F12>', self.show_metrics)
+
+    def on_close(self):
+        self.index.worker.stop()  # Let queued writes land first
+        get_storage().compact()  # Fold this session's journal into log_data.xml
+        self.root.destroy()
+
+    def report_io_error(self, error):
+        messagebox.showerror("Storage Error", f"Could not read or write the requisition log: {error}")
 
     def load_departments(self):
         self.departments = []
@@ -194,7 +695,7 @@ class MainMenu(BaseWindow):
                 for row in reader:
                     self.departments.append(row[0])
         except FileNotFoundError:
-            print(f"File not found: {file_path}")
+            log.warning("File not found: %s", file_path)
     
         # Create a StringVar to hold the selected department
        # self.department_var = tk.StringVar(self.root)
@@ -208,7 +709,7 @@ class MainMenu(BaseWindow):
     
     def filter_departments(self):
         selected_department = self.department_var.get()
-        print(f"Selected department: {selected_department}")
+        log.debug("Selected department: %s", selected_department)
     
         # Filter the list of departments based on the selected department
         filtered_departments = [department for department in self.departments if department == selected_department]
@@ -219,304 +720,2082 @@ class MainMenu(BaseWindow):
             self.department_menu['menu'].add_command(label=department, command=lambda value=department: self.department_var.set(value))
 
     def create_widgets(self):
-        new_requisition_button = tk.Button(self.frame, text="New Requisition", command=self.open_requisition)
-        new_requisition_button.pack(pady=10)
+        toolbar = tk.Frame(self.frame)
+        toolbar.pack(pady=10)
 
-        # Create a frame to hold both scrollable areas
-        self.requisitions_frame = tk.Frame(self.frame)
-        self.requisitions_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Create pending requisitions frame
-        self.pending_frame, self.pending_canvas, self.pending_inner = self.create_scrollable_area(self.requisitions_frame, "Pending Requisitions")
-        self.pending_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        new_requisition_button = tk.Button(toolbar, text="New Requisition", command=self.open_requisition)
+        new_requisition_button.pack(side=tk.LEFT, padx=5)
 
-        # Create completed requisitions frame
-        self.completed_frame, self.completed_canvas, self.completed_inner = self.create_scrollable_area(self.requisitions_frame, "Completed Requisitions")
-        self.completed_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+        complete_button = tk.Button(toolbar, text="Mark Selected Complete",
+                                    command=lambda: self.mark_selected(self.pending_list, Status.COMPLETED))
+        complete_button.pack(side=tk.LEFT, padx=5)
 
-        self.display_requisitions()
+        pending_button = tk.Button(toolbar, text="Mark Selected Pending",
+                                   command=lambda: self.mark_selected(self.completed_list, Status.PENDING))
+        pending_button.pack(side=tk.LEFT, padx=5)
 
-    def create_scrollable_area(self, parent, title):
-        frame = tk.LabelFrame(parent, text=title)
-        
-        canvas = tk.Canvas(frame)
-        scrollbar = tk.Scrollbar(frame, orient=tk.VERTICAL, command=canvas.yview)
-        
-        inner_frame = tk.Frame(canvas)
-        
-        canvas.create_window((0, 0), window=inner_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        canvas.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        
-        return frame, canvas, inner_frame
-
-    
-    def display_requisitions(self):
-        #print("Starting display_requisitions")
-        # Clear previous content
-        for widget in self.pending_inner.winfo_children():
-            widget.destroy()
-        for widget in self.completed_inner.winfo_children():
-            widget.destroy()
-
-        pending_count = 0
-        completed_count = 0
-
-        
-
-        for req in self.requisitions:
-            if req['Status'] == 'Pending':
-                self.draw_requisition(req, self.pending_inner)
-                pending_count += 1
-            else:
-                self.draw_requisition(req, self.completed_inner)
-                completed_count += 1
+        order_button = tk.Button(toolbar, text="Purchase Order", command=self.open_purchase_order)
+        order_button.pack(side=tk.LEFT, padx=5)
 
-        # Update scroll regions
-        self.pending_inner.update_idletasks()
-        self.pending_canvas.configure(scrollregion=self.pending_canvas.bbox("all"))
-    
-        self.completed_inner.update_idletasks()
-        self.completed_canvas.configure(scrollregion=self.completed_canvas.bbox("all"))
+        self.create_search_bar()
 
-        #print(f"Displayed {pending_count} pending and {completed_count} completed requisitions")
+        # Create a frame to hold both requisition lists
+        self.requisitions_frame = tk.Frame(self.frame)
+        self.requisitions_frame.pack(fill=tk.BOTH, expand=True)
 
+        self.pending_list = VirtualRequisitionList(self.requisitions_frame, "Pending Requisitions", self.toggle_status)
+        self.pending_list.frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-    def draw_requisition(self, req, parent_frame):
-        #print(f"Drawing requisition: {req['Requester']} - {req['Status']}")
-        frame = tk.Frame(parent_frame, relief=tk.RIDGE, borderwidth=1)
-        frame.pack(fill=tk.X, padx=5, pady=5, expand=True)
+        self.completed_list = VirtualRequisitionList(self.requisitions_frame, "Completed Requisitions", self.toggle_status)
+        self.completed_list.frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
 
-        header_frame = tk.Frame(frame)
-        header_frame.pack(fill=tk.X)
+        self.display_requisitions()
 
-        id_requester_label = tk.Label(header_frame, text=f"{req['ID']} - {req['Requester']}", anchor="w")
-        id_requester_label.pack(side=tk.LEFT, padx=5)
+    def create_search_bar(self):
+        search_bar = tk.Frame(self.frame)
+        search_bar.pack(pady=(0, 10))
+        self.search_job = None
+        self.search_text = tk.StringVar(self.root)
+        self.search_status = tk.StringVar(self.root, value="All")
+        self.search_from = tk.StringVar(self.root)
+        self.search_to = tk.StringVar(self.root)
+
+        tk.Label(search_bar, text="Search").pack(side=tk.LEFT)
+        search_entry = tk.Entry(search_bar, textvariable=self.search_text, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        status_combobox = ttk.Combobox(search_bar, textvariable=self.search_status, state="readonly", width=10,
+                                       values=["All", Status.PENDING.value, Status.COMPLETED.value])
+        status_combobox.pack(side=tk.LEFT, padx=5)
+        tk.Label(search_bar, text="From").pack(side=tk.LEFT)
+        from_entry = tk.Entry(search_bar, textvariable=self.search_from, width=11)
+        from_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(search_bar, text="To").pack(side=tk.LEFT)
+        to_entry = tk.Entry(search_bar, textvariable=self.search_to, width=11)
+        to_entry.pack(side=tk.LEFT, padx=5)
+        tk.Button(search_bar, text="Clear", command=self.clear_search).pack(side=tk.LEFT, padx=5)
+
+        for entry in (search_entry, from_entry, to_entry):
+            entry.bind('<KeyRelease>', self.schedule_search)
+        status_combobox.bind('<<ComboboxSelected>>', self.schedule_search)
+        self.root.bind('<Control-f>', lambda event: search_entry.focus_set())
+
+    def search_filters(self):
+        """ (text, status, date_from, date_to) from the search bar, None where it is empty """
+        status = self.search_status.get()
+        return (self.search_text.get().strip() or None,
+                None if status == "All" else Status(status),
+                self.search_from.get().strip() or None,
+                self.search_to.get().strip() or None)
+
+    def searching(self):
+        return any(self.search_filters())
+
+    def schedule_search(self, event=None):
+        # Only search once typing pauses, not on every key
+        if self.search_job:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.display_requisitions)
+
+    def clear_search(self):
+        for var in (self.search_text, self.search_from, self.search_to):
+            var.set("")
+        self.search_status.set("All")
+        self.display_requisitions()
 
-        status_color = "red" if req['Status'] == 'Pending' else "green"
-        status_label = tk.Label(header_frame, text=req['Status'], fg=status_color)
-        status_label.pack(side=tk.RIGHT, padx=5)
-        status_label.bind('<Button-1>', lambda e, r=req: self.toggle_status(r))
+    def display_requisitions(self):
+        self.search_job = None
+        with metrics.span('ui.display'):
+            if self.searching():
+                self.display_search_results()
+            else:
+                self.display_partitioned()
+
+    def display_search_results(self):
+        text, status, date_from, date_to = self.search_filters()
+        results = self.index.search.search(text, status, date_from, date_to)
+        self.display_partitioned(results)
+
+    def display_partitioned(self, requisitions=None):
+        pending = []
+        completed = []
+        for req in self.requisitions if requisitions is None else requisitions:
+            if req.status == Status.PENDING:
+                pending.append(req)
+            else:
+                completed.append(req)
+
+        self.pending_list.set_rows(pending)
+        self.completed_list.set_rows(completed)
+
+    def on_requisitions_changed(self, event, req=None, old_status=None):
+        if event == 'preview':
+            self.pending_list.set_rows(req)  # Completed fills in with the full load
+        elif event == 'reloaded':
+            self.requisitions = self.index.requisitions
+            log.info("Loaded %s requisitions", len(self.requisitions))
+            self.display_requisitions()
+        elif event == 'conflict':
+            messagebox.showwarning("Changed Elsewhere", f"{len(req)} requisitions were changed at another station "
+                                   "at the same time. Their change was kept.")
+        elif self.searching():
+            self.display_requisitions()  # Matches and their order may change, search again
+        elif event == 'added':
+            self.list_for(req.status).add_row(req)
+        elif event == 'status' and old_status != req.status:
+            self.list_for(old_status).remove_row(req)
+            self.list_for(req.status).add_row(req)
+        elif event in ('statuses', 'merged'):
+            self.display_requisitions()  # One redraw for the whole batch
+
+    def list_for(self, status):
+        return self.pending_list if status == Status.PENDING else self.completed_list
 
-    # Add date label for completed requisitions
-        if req['Status'] == 'Completed':
-            date_label = tk.Label(header_frame, text=req['Date'], anchor="e")
-            date_label.pack(side=tk.RIGHT, padx=5)
+    def toggle_status(self, req):
+        if req.status == Status.PENDING:
+            if messagebox.askyesno("Mark Complete", "Do you want to mark this requisition as complete?"):
+                update_xml_status(req.copy(status=Status.COMPLETED))
+        else:
+            if messagebox.askyesno("Mark Pending", "Do you want to mark this requisition as pending?"):
+                update_xml_status(req.copy(status=Status.PENDING))
 
-        if req['Status'] == 'Completed':
-            department_label = tk.Label(header_frame, text=req['Department'], anchor="e")
-            department_label.pack(side=tk.RIGHT, padx=5)
+    def mark_selected(self, requisition_list, status):
+        reqs = requisition_list.selected_requisitions()
+        if not reqs:
+            messagebox.showinfo("Nothing Selected", "Select one or more requisitions first.")
+            return
+        action = "complete" if status == Status.COMPLETED else "pending"
+        if messagebox.askyesno(f"Mark {action.title()}", f"Do you want to mark {len(reqs)} requisitions as {action}?"):
+            update_xml_statuses(reqs, status)
 
-    #Add date label for pending requisitions
-        if req['Status'] == 'Pending':
-            date_label = tk.Label(header_frame, text=req['Date'], anchor="e")
-            date_label.pack(side=tk.RIGHT, padx=5)
-    #Add Department label for pending requisitions
-        if req['Status'] == 'Pending':
-            department_label = tk.Label(header_frame, text=req['Department'], anchor="e")
-            department_label.pack(side=tk.RIGHT, padx=5)
+    def mark_complete(self, req):
+        update_xml_status(req.copy(status=Status.COMPLETED))
 
-        items_frame = tk.Frame(frame)
-        items_frame.pack(fill=tk.X)
+    def refresh_requisitions(self):
+        # The index only reloads, and tells us to redraw, if the files changed on disk.
+        # The check and any reload happen on the I/O thread.
+        self.index.validate()
 
-        tk.Label(items_frame, text="Item", width=30, anchor="w").grid(row=0, column=0, padx=5)
-        tk.Label(items_frame, text="Qty", width=10, anchor="w").grid(row=0, column=1, padx=5)
+    def show_metrics(self, event=None):
+        messagebox.showinfo("Timing Report", metrics.report())
 
-        for i, (item, qty) in enumerate(req['Items'], start=1):
-            tk.Label(items_frame, text=item, anchor="w").grid(row=i, column=0, padx=5, sticky="w")
-            tk.Label(items_frame, text=qty, anchor="w").grid(row=i, column=1, padx=5, sticky="w")
+    def get_stock_items(self):
+        if self.stock_items is None:
+            self.stock_items = load_stock_items()  # Wanted before the worker got to it
+        return self.stock_items
 
-        #print(f"Finished drawing requisition: {req['Requester']}")
+    def stock_loaded(self, stock_items):
+        if self.stock_items is None:
+            self.stock_items = stock_items
 
-    
-    def toggle_status(self, req):
-        if req['Status'] == 'Pending':
-            if messagebox.askyesno("Mark Complete", "Do you want to mark requisition {req['ID']} for {['Requester']} as complete?"):
-                req['Status'] = 'Completed'
-                update_xml_status(req)
-                self.refresh_requisitions()
-        else:
-            if messagebox.askyesno("Mark Pending", "Do you want to mark requisition {req['ID']} for {['Requester']} as pending?"):
-                req['Status'] = 'Pending'
-                update_xml_status(req)
-                self.refresh_requisitions()
-    
-    def refresh_requisitions(self):
-        self.requisitions = self.load_requisitions()
-        #print(f"Refreshed requisitions. Total count: {len(self.requisitions)}")
-        self.display_requisitions()
-        self.root.update()  # Force update of the main window
+    def open_purchase_order(self):
+        PurchaseOrderWindow(self.index, self.get_stock_items(), self.root)
 
     def open_requisition(self):
         self.root.withdraw()  # Hide the main window
         departments = self.load_departments()
         if not departments:
                 departments = ['Stores']
-        req_window = RequisitionWindow(self.stock_items,departments, self.root)
+        req_window = RequisitionWindow(self.get_stock_items(),departments, self.root, self.index.history)
         self.root.wait_window(req_window.root)
         self.root.deiconify()  # Show the main window again
         self.refresh_requisitions()
 
     def load_requisitions(self):
-        requisitions = []
-        file_path = LOG_DATA_FILE
-        try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            for req in root.findall('requisition'):
-                requisition = {
-                'ID': req.find('ID').text if req.find('ID') is not None else str(uuid.uuid4())[:8],
-                'Requester': req.find('Requester').text,
-                'Date': req.find('Date').text,
-                'Status': req.find('Status').text,
-                'Department': req.find('Department').text if req.find('Department') is not None else '',
-                'Items': [(item.find('Name').text, item.find('Quantity').text) for item in req.find('Items')]
-                }
-                requisitions.append(requisition)
-            print(f"Loaded {len(requisitions)} requisitions")
-            for idx, req in enumerate(requisitions):
-                print(f"Requisition {idx + 1}: {req['ID']} - {req['Requester']} - {req['Status']}")
-        except FileNotFoundError:
-            print(f"File not found: {file_path}")
-        except ET.ParseError as e:
-            print(f"Error parsing XML: {e}")
-        return requisitions
-
-
-    def toggle_status(self, req):
-        if req['Status'] == 'Pending':
-            if messagebox.askyesno("Mark Complete", "Do you want to mark this requisition as complete?"):
-                req['Status'] = 'Completed'
-                update_xml_status(req)
-                self.refresh_requisitions()
-        else:
-            if messagebox.askyesno("Mark Pending", "Do you want to mark this requisition as pending?"):
-                req['Status'] = 'Pending'
-                update_xml_status(req)
-                self.refresh_requisitions()
-    
-    def mark_complete(self, req):
-        req['Status'] = 'Completed'
-        update_xml_status(req)
+        # The worker loads in the background and the panes fill in on the 'preview' and 'reloaded' events.
+        # This is the only full load at start up, the periodic check after it reads just what changed.
+        self.index = get_requisition_index(validate=False)
+        self.index.subscribe(self.on_requisitions_changed)
+        self.index.worker = IOWorker(self.root, on_error=self.report_io_error)
+        self.index.warm_start()
+        if self.stock_items is None:
+            self.index.worker.submit(load_stock_items, on_done=self.stock_loaded)
+        return self.index.requisitions
+
+    def auto_refresh(self):
+        # Picks up what other stations saved; costs a stat per file while nothing changes
         self.refresh_requisitions()
+        self.root.after(REFRESH_MS, self.auto_refresh)
 
-    def refresh_requisitions(self):
-        self.requisitions = self.load_requisitions()
-        self.display_requisitions()
-        
     def run(self):
-        self.root.after(100, self.refresh_requisitions)  # Refresh shortly after starting
+        # __init__ already started the first load, the first check only comes after that
+        if REFRESH_MS:
+            self.root.after(REFRESH_MS, self.auto_refresh)
         self.root.mainloop()
 
-def load_stock_items(filename='stock_items.csv'):
+class StockCatalogue(list):
+    """ Stock item names plus a search index that is built once when the catalogue is loaded.
+
+    Queries of three or more characters intersect trigram posting lists and
+    rank what is left; shorter ones walk the sorted names and words with bisect.
+    Either way the cost depends on the number of matches, not the catalogue size.
+    """
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.names = set(self)
+        self.lowered = [item.lower() for item in self]
+        self.sorted_names = sorted((name, i) for i, name in enumerate(self.lowered))
+        self.sorted_words = sorted({(word, i) for i, name in enumerate(self.lowered) for word in name.split()})
+        self.trigrams = {}
+        for i, name in enumerate(self.lowered):
+            for gram in {name[j:j + 3] for j in range(len(name) - 2)}:
+                self.trigrams.setdefault(gram, []).append(i)
+
+    def __contains__(self, item):
+        return item in self.names
+
+    def rank(self, i, query):
+        name = self.lowered[i]
+        if name == query:
+            return (0, name)
+        if name.startswith(query):
+            return (1, name)
+        if (' ' + query) in name:
+            return (2, name)  # Starts one of the words
+        return (3, name)
+
+    def prefix_matches(self, sorted_entries, query):
+        start = bisect.bisect_left(sorted_entries, (query, -1))
+        for text, i in itertools.islice(sorted_entries, start, None):
+            if not text.startswith(query):
+                break
+            yield i
+
+    @metrics.timed('stock.search')
+    def search(self, text, limit=STOCK_SEARCH_LIMIT):
+        query = text.strip().lower()
+        if not query:
+            return self[:limit]
+
+        if len(query) >= 3:
+            postings = sorted((self.trigrams.get(query[j:j + 3], []) for j in range(len(query) - 2)), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            matches = (i for i in candidates if query in self.lowered[i])
+            return [self[i] for i in heapq.nsmallest(limit, matches, key=lambda i: self.rank(i, query))]
+
+        # One or two characters match too much to rank, take them in rank order until the limit
+        found = {}
+        ranked = itertools.chain(
+            self.prefix_matches(self.sorted_names, query),
+            self.prefix_matches(self.sorted_words, query),
+            (i for i, name in enumerate(self.lowered) if query in name),
+        )
+        for i in ranked:
+            found.setdefault(i, None)
+            if len(found) >= limit:
+                break
+        return [self[i] for i in found]
+
+
+def decode_catalogue(raw_data):
+    """ Decode the catalogue bytes, only paying for chardet when the file is not UTF-8 """
+    try:
+        return raw_data.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    import chardet  # Slow to import, and most catalogues never need it
+
+    # chardet is slow on big inputs, a sample from the start of the file is enough to guess
+    detected = chardet.detect(raw_data[:ENCODING_SAMPLE_SIZE])
+    log.info("Detected encoding: %s", detected['encoding'])
+    for encoding in (detected['encoding'], 'latin-1'):
+        if not encoding:
+            continue
+        try:
+            return raw_data.decode(encoding), encoding
+        except (UnicodeDecodeError, LookupError) as e:
+            log.warning("Failed to read with %s encoding: %s", encoding, e)
+    return raw_data.decode('latin-1', errors='replace'), 'latin-1'
+
+
+def parse_catalogue(text):
     stock_items = []
+    reader = csv.reader(io.StringIO(text))
+    next(reader, None)  # Skip header, use None to handle empty files
+    for row in reader:
+        if row:  # Check if the row is not empty
+            stock_items.append(row[0].strip())  # Assuming stock names are in the first column, strip whitespace
+    return stock_items
+
+
+def read_stock_cache(cache_path):
+    # Plain JSON, never pickle: the cache sits on the shared drive and any station can write it
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+        if isinstance(cache, dict) and cache.get('version') == STOCK_CACHE_VERSION:
+            return cache
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning("Ignoring unreadable stock cache %s: %s", cache_path, e)
+    return None
+
+
+def write_stock_cache(cache_path, cache):
+    try:
+        # Stations starting together each write their own temp file, never one another's half-written one
+        os.replace(write_temp_file(cache_path, lambda f: f.write(json.dumps(cache, ensure_ascii=False).encode('utf-8'))),
+                   cache_path)
+    except OSError as e:
+        log.warning("Could not write stock cache %s: %s", cache_path, e)
+
+
+@metrics.timed('stock.load')
+def load_stock_items(filename='stock_items.csv'):
     script_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(script_dir, filename)
+    cache_path = os.path.splitext(file_path)[0] + '.cache'
 
-    #print(f"Attempting to load stock items from: {file_path}")
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        log.error("Error loading stock items: %s", e)
+        return StockCatalogue()
+
+    # An unchanged size and mtime means the cached list can be used without reading the CSV
+    key = [stat.st_size, stat.st_mtime_ns]
+    cache = read_stock_cache(cache_path)
+    if cache and cache['key'] == key:
+        return StockCatalogue(cache['items'])
 
-    # Detect the file encoding
     try:
         with open(file_path, 'rb') as file:
             raw_data = file.read()
-        detected = chardet.detect(raw_data)
-        encoding = detected['encoding']
-        print(f"Detected encoding: {encoding}")
     except IOError as e:
-        print(f"Error reading file for encoding detection: {e}")
-        return stock_items
+        log.error("Error loading stock items: %s", e)
+        return StockCatalogue()
+
+    digest = hashlib.sha1(raw_data).hexdigest()
+    if cache and cache['hash'] == digest:
+        # Touched or copied but not edited
+        stock_items, encoding = cache['items'], cache['encoding']
+    else:
+        text, encoding = decode_catalogue(raw_data)
+        stock_items = parse_catalogue(text)
+
+    write_stock_cache(cache_path, {
+        'version': STOCK_CACHE_VERSION,
+        'key': key,
+        'hash': digest,
+        'encoding': encoding,
+        'items': stock_items,
+    })
+    return StockCatalogue(stock_items)
+
+
+def requisition_to_element(requisition, parent=None):
+    req_elem = ET.SubElement(parent, "requisition") if parent is not None else ET.Element("requisition")
+    ET.SubElement(req_elem, "ID").text = requisition.id or str(uuid.uuid4())[:8]  # Use first 8 characters of a UUID
+    ET.SubElement(req_elem, "Requester").text = requisition.requester
+    ET.SubElement(req_elem, "Date").text = requisition.date
+    ET.SubElement(req_elem, "Status").text = str(requisition.status)
+    ET.SubElement(req_elem, "Department").text = requisition.department
+    if requisition.version:
+        ET.SubElement(req_elem, "Version").text = str(requisition.version)
 
-    # Try to read the file with the detected encoding
-    try:
-        with open(file_path, mode='r', encoding=encoding) as file:
-            reader = csv.reader(file)
-            next(reader, None)  # Skip header, use None to handle empty files
-            for row in reader:
-                if row:  # Check if the row is not empty
-                    stock_items.append(row[0].strip())  # Assuming stock names are in the first column, strip whitespace
-    except UnicodeDecodeError as e:
-        print(f"Error with detected encoding: {e}. Trying with 'utf-8' and 'latin-1' encodings.")
-        
-        # If the detected encoding fails, try with 'utf-8' and then 'latin-1'
-        for fallback_encoding in ['utf-8', 'latin-1']:
+    items_elem = ET.SubElement(req_elem, "Items")
+    for item, quantity in requisition.items:
+        item_elem = ET.SubElement(items_elem, "Item")
+        ET.SubElement(item_elem, "Name").text = item
+        ET.SubElement(item_elem, "Quantity").text = str(quantity)
+    return req_elem
+
+
+class LazyItems:
+    """ Items of a requisition as the (name, quantity) text read from the XML, made LineItems when first used """
+    __slots__ = ('_texts', '_items')
+
+    def __init__(self, element):
+        # Only the text is kept: a detached <Items> element costs about three times the LineItems
+        self._texts = tuple((item.findtext('Name'), item.findtext('Quantity'))
+                            for item in element) if element is not None else ()
+        self._items = None
+
+    def materialize(self):
+        if self._items is None:
+            texts, self._texts = self._texts, None
+            self._items = [make_line_item(name, quantity) for name, quantity in texts]
+        return self._items
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self.materialize())
+
+    def __getitem__(self, index):
+        return self.materialize()[index]
+
+    def __repr__(self):
+        return repr(self.materialize()) if self._items is not None else "LazyItems(...)"
+
+
+def element_to_requisition(req, lazy_items=False):
+    fields = {child.tag: child.text for child in req if child.tag != 'Items'}
+    items = LazyItems(req.find('Items'))
+    return Requisition(
+        id=fields.get('ID') or str(uuid.uuid4())[:8],
+        requester=intern_text(fields.get('Requester')),
+        date=fields.get('Date') or '',
+        status=Status.parse(fields.get('Status')),
+        department=intern_text(fields.get('Department')),
+        items=items if lazy_items else items.materialize(),
+        version=int(fields.get('Version') or 0),
+    )
+
+
+def iter_requisitions(file_path=LOG_DATA_FILE, lazy_items=True, stop_after_pending=None):
+    """ Stream requisitions out of log_data.xml without building the whole tree.
+
+    Each <requisition> is dropped from memory as soon as it has been read. With
+    lazy_items only the item text is kept, and turned into LineItems when the
+    card needs it. stop_after_pending stops reading once that many Pending
+    requisitions have been yielded.
+    """
+    pending_count = 0
+    root = None
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        if root is None:
+            root = elem
+            continue
+        if event != 'end' or elem.tag != 'requisition':
+            continue
+
+        requisition = element_to_requisition(elem, lazy_items)
+        root.clear()
+        yield requisition
+
+        if requisition.status == Status.PENDING:
+            pending_count += 1
+            if stop_after_pending is not None and pending_count >= stop_after_pending:
+                return
+
+
+class ConflictError(Exception):
+    """ Another station changed the requisition first """
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """ Advisory lock on path + '.lock', which every station sharing the log takes before writing """
+    deadline = time.monotonic() + timeout
+    with open(path + '.lock', 'a+b') as f:
+        while True:
             try:
-                with open(file_path, mode='r', encoding=fallback_encoding) as file:
-                    reader = csv.reader(file)
-                    next(reader, None)  # Skip header, use None to handle empty files
-                    for row in reader:
-                        if row:  # Check if the row is not empty
-                            stock_items.append(row[0].strip())  # Assuming stock names are in the first column, strip whitespace
-                print(f"Successfully read file with {fallback_encoding} encoding.")
-                break  # Exit the loop if successful
-            except UnicodeDecodeError:
-                print(f"Failed to read with {fallback_encoding} encoding.")
-    except IOError as e:
-        print(f"Error loading stock items: {e}")
+                if fcntl:
+                    fcntl.lockf(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"{path} is locked by another station")
+                time.sleep(0.01)
+        try:
+            with metrics.span('storage.locked'):
+                yield
+        finally:
+            if fcntl:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
 
-    #print(f"Loaded {len(stock_items)} stock items.")
-    return stock_items
 
+def write_temp_file(path, write):
+    """ write(f) into a new file next to path and flush it to disk, returning its name.
 
-def save_to_xml(requisition):
-    file_path = LOG_DATA_FILE
-    
+    Each station gets its own temp file, and the caller swaps it in with
+    os.replace, so readers only ever see the old or the new file.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path) or '.')
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-    except (FileNotFoundError, ET.ParseError):
-        root = ET.Element("requisitions")
-        tree = ET.ElementTree(root)
-
-    req_elem = ET.SubElement(root, "requisition")
-    ET.SubElement(req_elem, "ID").text = str(uuid.uuid4())[:8]  # Use first 8 characters of a UUID
-    ET.SubElement(req_elem, "Requester").text = requisition["Requester"]
-    ET.SubElement(req_elem, "Date").text = requisition["Date"]
-    ET.SubElement(req_elem, "Status").text = requisition["Status"]
-    ET.SubElement(req_elem, "Department").text = requisition["Department"]
-    
-    items_elem = ET.SubElement(req_elem, "Items")
-    for item, quantity in requisition["Items"]:
-        item_elem = ET.SubElement(items_elem, "Item")
-        ET.SubElement(item_elem, "Name").text = item
-        ET.SubElement(item_elem, "Quantity").text = quantity
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def append_journal(entry, journal_path=JOURNAL_FILE):
+    """ Append one record to the journal and make sure it hits the disk """
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+    with metrics.span('storage.write'), file_lock(journal_path), open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+    metrics.count('journal.records')
+
+
+def read_journal(journal_path=JOURNAL_FILE):
+    entries = []
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A crash halfway through an append leaves a torn last line, skip it
+                    log.warning("Skipping unreadable journal line %s in %s", line_number, journal_path)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_journal_tail(journal_path, offset, end=None):
+    """ Entries appended after offset, up to end if given, and the offset just past the last complete line.
+
+    A line another station is still writing is left for the next read.
+    """
+    with open(journal_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read() if end is None else f.read(end - offset)
+    complete = data.rfind(b"\n") + 1
+    entries = []
+    for line in data[:complete].splitlines():
+        try:
+            if line.strip():
+                entries.append(json.loads(line))
+        except ValueError:
+            log.warning("Skipping unreadable journal line after offset %s in %s", offset, journal_path)
+    return entries, offset + complete
+
+
+def journal_additions(entry):
+    """ Requisition dicts added by a journal entry: one for 'add', a batch for 'adds' and 'batch' """
+    if entry.get('op') == 'add':
+        return [entry['requisition']]
+    if entry.get('op') in ('adds', 'batch'):
+        return entry['requisitions']
+    return []
+
+
+def journal_changes(entry):
+    """ Status changes made by a journal entry: itself for 'status', a batch for 'statuses' and 'batch' """
+    if entry.get('op') == 'status':
+        return [entry]
+    if entry.get('op') in ('statuses', 'batch'):
+        return entry['changes']
+    return []
+
+
+def change_status(entry, change):
+    # 'batch' changes carry their own status, 'statuses' share the entry's
+    return change.get('Status') or entry['Status']
+
+
+def apply_journal_entry(requisitions, by_id, by_key, entry):
+    for data in journal_additions(entry):
+        requisition = Requisition.from_dict(data)
+        if requisition.id not in by_id:
+            requisitions.append(requisition)
+            by_id[requisition.id] = requisition
+            by_key[requisition.key] = requisition
+    for change in journal_changes(entry):
+        apply_status_change(by_id, by_key, change, change_status(entry, change))
+
+
+def find_change_target(by_id, by_key, change):
+    req = by_id.get(change.get('ID'))
+    if req is None:
+        # Records written before IDs existed are matched on Requester and Date
+        req = by_key.get((change.get('Requester'), change.get('Date')))
+    return req
+
+
+def apply_status_change(by_id, by_key, change, status):
+    """ False if the change lost to an earlier one made from the same version """
+    req = find_change_target(by_id, by_key, change)
+    if req is None:
+        return True
+    version = change.get('Version')
+    if version is None:
+        req.version += 1  # Written before versions existed
+    elif version <= req.version:
+        return False  # Two stations changed the same version, the first one in the journal wins
+    else:
+        req.version = version
+    req.status = Status.parse(status)
+    return True
+
+
+def load_requisitions(file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE, journal_end=None, strict=False):
+    """ Load the snapshot in log_data.xml and replay the journal, up to journal_end if given, on top of it.
+
+    A damaged log_data.xml gives what could be read before the damage, or
+    raises ET.ParseError if strict; anything about to be written back over it
+    must be strict.
+    """
+    requisitions = []
+    with metrics.span('load.parse'):
+        try:
+            for requisition in iter_requisitions(file_path):
+                requisitions.append(requisition)
+        except FileNotFoundError:
+            log.warning("File not found: %s", file_path)
+        except ET.ParseError as e:
+            if strict:
+                raise
+            log.error("Error parsing XML: %s", e)
+    metrics.count('requisitions.parsed', len(requisitions))
+
+    with metrics.span('load.journal'):
+        by_id = {req.id: req for req in requisitions}
+        by_key = {req.key: req for req in requisitions}
+        if journal_end is None:
+            entries = read_journal(journal_path)
+        else:
+            entries = read_journal_tail(journal_path, 0, journal_end)[0] if journal_end else []
+        for entry in entries:
+            apply_journal_entry(requisitions, by_id, by_key, entry)
+    return requisitions
+
+
+def iter_log(file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE):
+    """ The same requisitions as load_requisitions, but streamed; only the journal and the IDs are held in memory.
+
+    Like find_change_target, a change falls back to Requester and Date when no
+    requisition has its ID. A requisition that such a change could reach waits
+    until the rest of log_data.xml has been read, so those come out last.
+    """
+    added = []
+    changes_by_id = {}
+    changes_by_key = {}
+    for position, entry in enumerate(read_journal(journal_path)):
+        added.extend(journal_additions(entry))
+        for change in journal_changes(entry):
+            settled = (position, change, change_status(entry, change))
+            if change.get('ID'):
+                changes_by_id.setdefault(change['ID'], []).append(settled)
+            changes_by_key.setdefault((change.get('Requester'), change.get('Date')), []).append(settled)
+    ids = {data['ID'] for data in added if data.get('ID')}
+
+    def changes_by_key_only(req):
+        return [settled for settled in changes_by_key.get(req.key, ()) if settled[1].get('ID') != req.id]
+
+    def settle(req):
+        changes = changes_by_id.get(req.id, []) + [settled for settled in changes_by_key_only(req)
+                                                   if settled[1].get('ID') not in ids]
+        for _, change, status in sorted(changes, key=lambda change: change[0]):
+            apply_status_change({req.id: req}, {req.key: req}, change, status)
+        return req
+
+    seen = set()
+    waiting = []
+    try:
+        for req in iter_requisitions(file_path):
+            seen.add(req.id)
+            ids.add(req.id)
+            if any(settled[1].get('ID') and settled[1]['ID'] not in ids for settled in changes_by_key_only(req)):
+                waiting.append(req)  # The ID that change names may still turn up further on
+            else:
+                yield settle(req)
+    except FileNotFoundError:
+        log.warning("File not found: %s", file_path)
+    for req in waiting:
+        yield settle(req)
+    for data in added:
+        req = Requisition.from_dict(data)
+        if req.id not in seen:
+            seen.add(req.id)
+            yield settle(req)
+
+
+@dataclass(frozen=True, slots=True)
+class FileState:
+    """ What a file looked like: mtime, size and digests of its first and last block.
+
+    The digests alone miss an edit in the middle that keeps the size, so any
+    new mtime counts as a change; appended_since tells a pure append apart.
+    """
+    mtime_ns: int
+    size: int
+    head: bytes
+    tail: bytes
+
+
+def block_digest(f, start, end):
+    f.seek(start)
+    return hashlib.sha1(f.read(end - start)).digest()
+
+
+def file_state(path, previous=None, size=None):
+    """ FileState of path, up to size bytes if given, or None if it does not exist """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if size is None and previous is not None and (previous.mtime_ns, previous.size) == (stat.st_mtime_ns, stat.st_size):
+        return previous  # Untouched since last time, no need to read it
+    size = stat.st_size if size is None else size
+    with open(path, 'rb') as f:
+        return FileState(stat.st_mtime_ns, size,
+                         block_digest(f, 0, min(size, FINGERPRINT_BLOCK)),
+                         block_digest(f, max(0, size - FINGERPRINT_BLOCK), size))
+
+
+def appended_since(path, previous, current):
+    """ True if the file only grew since previous, so the bytes previous covered are still there """
+    if previous is None:
+        return current is not None
+    if current is None or current.size <= previous.size:
+        return False
+    with open(path, 'rb') as f:
+        return (block_digest(f, 0, min(previous.size, FINGERPRINT_BLOCK)) == previous.head and
+                block_digest(f, max(0, previous.size - FINGERPRINT_BLOCK), previous.size) == previous.tail)
+
+
+@metrics.timed('storage.snapshot')
+def prepare_snapshot(requisitions, file_path=LOG_DATA_FILE):
+    """ Write the requisitions to a temp file next to file_path and return its name """
+    # A fresh stamp at the top of every snapshot, so a rewritten log never looks like the old one
+    root = ET.Element("requisitions", stamp=uuid.uuid4().hex[:12])
+    for requisition in requisitions:
+        requisition_to_element(requisition, root)
+    return write_temp_file(file_path, lambda f: ET.ElementTree(root).write(f, encoding="utf-8", xml_declaration=True))
+
+
+def write_snapshot(requisitions, file_path=LOG_DATA_FILE):
+    os.replace(prepare_snapshot(requisitions, file_path), file_path)
+
+
+def read_log_for_rewrite(file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE):
+    """ The requisitions as of now, plus the (log_data.xml state, journal length) they were read at.
+
+    The lock is only held to take the measurements; the log is read after it
+    is released and commit_snapshot checks nobody rewrote it meanwhile. Raises
+    ET.ParseError rather than hand back part of a damaged log_data.xml.
+    """
+    with file_lock(journal_path):
+        xml_state = file_state(file_path)
+        journal_end = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+    return load_requisitions(file_path, journal_path, journal_end, strict=True), (xml_state, journal_end)
+
+
+def commit_snapshot(tmp_path, read_at, file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE):
+    """ Swap in a snapshot made from the log as it was at read_at.
+
+    Journal lines other stations appended after that are carried over to the
+    new journal. Returns the signature the snapshot alone was written at, or
+    None, dropping the snapshot, if another station rewrote log_data.xml
+    first, since theirs already holds our journal.
+    """
+    xml_state, journal_end = read_at
+    with file_lock(journal_path):
+        if file_state(file_path) != xml_state:
+            os.remove(tmp_path)
+            log.info("%s was rewritten by another station, keeping theirs", file_path)
+            return None
+        rest = b""
+        if os.path.exists(journal_path):
+            with open(journal_path, 'rb') as f:
+                f.seek(journal_end)
+                rest = f.read()
+        journal_tmp = write_temp_file(journal_path, lambda f: f.write(rest))
+        os.replace(tmp_path, file_path)
+        os.replace(journal_tmp, journal_path)
+        # The carried over lines are not in the snapshot, so it stands for an empty journal
+        return file_state(file_path), file_state(journal_path, size=0)
+
+
+def requisition_to_row(req):
+    return [req.id, req.requester, req.date, str(req.status), req.department, req.version,
+            [[name, quantity] for name, quantity in req.items]]
+
+
+def row_to_requisition(row):
+    req_id, requester, date, status, department, version, items = row
+    return Requisition(req_id, intern_text(requester), date, Status.parse(status), intern_text(department),
+                       [LineItem(intern_text(name), quantity) for name, quantity in items], version)
+
+
+def file_state_to_json(state):
+    return state and [state.mtime_ns, state.size, state.head.hex(), state.tail.hex()]
+
+
+def file_state_from_json(data):
+    return data and FileState(data[0], data[1], bytes.fromhex(data[2]), bytes.fromhex(data[3]))
+
+
+def write_warm_start(warm_path, requisitions, signature):
+    """ Save the parsed log so the next start can skip parsing log_data.xml.
+
+    Two JSON lines, never pickle since the file sits on the shared drive: the
+    header with the Pending requisitions and where they go, then the rest, so
+    the window can show Pending before the rest is read.
+    """
+    pending_at = [i for i, req in enumerate(requisitions) if req.status == Status.PENDING]
+    header = {'version': WARM_START_VERSION, 'signature': [file_state_to_json(state) for state in signature],
+              'pending_at': pending_at, 'pending': [requisition_to_row(requisitions[i]) for i in pending_at]}
+    rest = [requisition_to_row(req) for req in requisitions if req.status != Status.PENDING]
+    def dump(f):
+        f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b"\n")
+        f.write(json.dumps(rest, ensure_ascii=False).encode('utf-8') + b"\n")
+    try:
+        os.replace(write_temp_file(warm_path, dump), warm_path)
+    except OSError as e:
+        log.warning("Could not write warm start file %s: %s", warm_path, e)
 
-    tree.write(file_path, encoding="utf-8", xml_declaration=True)
-    print(f"Requisition saved to {file_path}")
-    
+
+def read_warm_start(warm_path):
+    """ Yield (signature, pending requisitions), then all requisitions, if warm_path holds a usable file """
     try:
-        tree.write(file_path, encoding="utf-8", xml_declaration=True)
-        print(f"Requisition saved to {file_path}")
+        with open(warm_path, 'rb') as f:
+            header = json.loads(f.readline())
+            if not isinstance(header, dict) or header.get('version') != WARM_START_VERSION:
+                return
+            pending = [row_to_requisition(row) for row in header['pending']]
+            yield tuple(file_state_from_json(state) for state in header['signature']), pending
+            rest = iter([row_to_requisition(row) for row in json.loads(f.readline())])
+            requisitions = []
+            for i, req in zip(header['pending_at'], pending):
+                requisitions.extend(itertools.islice(rest, i - len(requisitions)))
+                requisitions.append(req)
+            requisitions.extend(rest)
+            yield requisitions
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning("Ignoring unreadable warm start file %s: %s", warm_path, e)
+
+
+def compact_journal(file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE, warm_path=None):
+    """ Fold the journal back into log_data.xml and start a fresh journal """
+    if not os.path.exists(journal_path) or os.path.getsize(journal_path) == 0:
+        return False
+    try:
+        requisitions, read_at = read_log_for_rewrite(file_path, journal_path)
+        signature = commit_snapshot(prepare_snapshot(requisitions, file_path), read_at, file_path, journal_path)
+        if signature is None:
+            return False
+        if warm_path:
+            write_warm_start(warm_path, requisitions, signature)
+        index = _indexes.get(('xml', file_path, journal_path))
+        if index is not None:
+            index.signature = None  # Same records, but the files moved; the next check reloads
+        log.info("Compacted journal into %s", file_path)
         return True
     except Exception as e:
-        print(f"Error saving requisition: {e}")
+        log.error("Error compacting journal: %s", e)
         return False
 
-def update_xml_status(updated_req,):
-    file_path = LOG_DATA_FILE
-    
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    for req in root.findall('requisition'):
-        # First, try to match by ID if it exists
-        if 'ID' in updated_req and req.find('ID') is not None:
-            if req.find('ID').text == updated_req['ID']:
-                req.find('Status').text = updated_req['Status']
+
+def parse_request_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return None
+
+
+def archive_partition_path(archive_dir, month):
+    return os.path.join(archive_dir, f"requisitions-{month}.xml")
+
+
+def archive_partitions(archive_dir=ARCHIVE_DIR):
+    """ (month, path) for every archive file, oldest first """
+    try:
+        names = os.listdir(archive_dir)
+    except FileNotFoundError:
+        return []
+    partitions = []
+    for name in names:
+        match = re.fullmatch(r'requisitions-(\d{4}-\d{2})\.xml', name)
+        if match:
+            partitions.append((match.group(1), os.path.join(archive_dir, name)))
+    return sorted(partitions)
+
+
+def archive_completed(file_path=LOG_DATA_FILE, journal_path=JOURNAL_FILE, archive_dir=ARCHIVE_DIR,
+                      max_age_days=ARCHIVE_AFTER_DAYS, now=None, warm_path=None):
+    """ Move Completed requisitions older than max_age_days into per-month archive files.
+
+    The journal is folded in at the same time, so log_data.xml ends up holding
+    only Pending and recent work. The archives are written before the active
+    file, so a crash part way leaves a requisition in both places rather than
+    in neither; merging by ID makes running it again safe.
+    """
+    cutoff = (now or datetime.now()) - timedelta(days=max_age_days)
+    active = []
+    by_month = {}
+    requisitions, read_at = read_log_for_rewrite(file_path, journal_path)
+    for req in requisitions:
+        date = parse_request_date(req.date)
+        if req.status == Status.COMPLETED and date is not None and date < cutoff:
+            by_month.setdefault(date.strftime('%Y-%m'), []).append(req)
+        else:
+            active.append(req)
+    if not by_month:
+        return 0
+
+    os.makedirs(archive_dir, exist_ok=True)
+    for month, reqs in by_month.items():
+        path = archive_partition_path(archive_dir, month)
+        with file_lock(path):
+            archived = list(iter_requisitions(path, lazy_items=False)) if os.path.exists(path) else []
+            known = {req.id for req in archived}
+            archived.extend(req for req in reqs if req.id not in known)
+            archived.sort(key=lambda req: req.date)
+            write_snapshot(archived, path)
+
+    signature = commit_snapshot(prepare_snapshot(active, file_path), read_at, file_path, journal_path)
+    if signature is None:
+        return 0  # Whoever got there first archived them as well
+    if warm_path:
+        write_warm_start(warm_path, active, signature)
+    count = sum(len(reqs) for reqs in by_month.values())
+    log.info("Archived %s completed requisitions into %s monthly files in %s", count, len(by_month), archive_dir)
+    return count
+
+
+def requisition_matches(req, text=None, status=None, department=None, date_from=None, date_to=None):
+    """ date_from and date_to are date prefixes such as '2024-10' or '2024-10-03' """
+    if status is not None and req.status != status:
+        return False
+    if department is not None and req.department != department:
+        return False
+    if date_from is not None and req.date[:len(date_from)] < date_from:
+        return False
+    if date_to is not None and req.date[:len(date_to)] > date_to:
+        return False
+    if text:
+        text = text.lower()
+        fields = [req.id, req.requester, req.department] + [name for name, _ in req.items]
+        if not any(text in field.lower() for field in fields):
+            return False
+    return True
+
+
+def search_partition(path, filters):
+    """ Runs in a worker process, so it returns plain data """
+    return [req for req in iter_requisitions(path, lazy_items=False) if requisition_matches(req, **filters)]
+
+
+def search_archive(text=None, status=None, department=None, date_from=None, date_to=None,
+                   archive_dir=ARCHIVE_DIR, max_workers=None):
+    """ Search the monthly archives, only opening months the date range can touch """
+    paths = [path for month, path in archive_partitions(archive_dir)
+             if (date_from is None or month >= date_from[:7]) and (date_to is None or month <= date_to[:7])]
+    filters = dict(text=text, status=status, department=department, date_from=date_from, date_to=date_to)
+    if len(paths) <= 1:
+        results = [search_partition(path, filters) for path in paths]
+    else:
+        from concurrent.futures import ProcessPoolExecutor  # Pulls in multiprocessing, only worth it here
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(search_partition, paths, itertools.repeat(filters)))
+    return [req for partition in results for req in partition]
+
+
+class XmlJournalStorage:
+    """ Requisitions kept in the log_data.xml snapshot plus its append-only journal """
+
+    def __init__(self, file_path=None, journal_path=None, archive_dir=None):
+        self.file_path = file_path or LOG_DATA_FILE
+        self.journal_path = journal_path or JOURNAL_FILE
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self.warm_path = os.path.splitext(self.file_path)[0] + '.warm'
+        self.key = ('xml', self.file_path, self.journal_path)
+        self.path = self.journal_path
+
+    def signature(self, previous=None):
+        previous_xml, previous_journal = previous or (None, None)
+        return file_state(self.file_path, previous_xml), file_state(self.journal_path, previous_journal)
+
+    def read_appended(self, previous, current):
+        """ Journal entries added since previous, or None if a full load is needed """
+        if previous is None or previous[0] != current[0] or not appended_since(self.journal_path, previous[1], current[1]):
+            return None
+        offset = previous[1].size if previous[1] else 0
+        entries, end = read_journal_tail(self.journal_path, offset)
+        # Only claim what was read, so a half-written last line is picked up next time
+        return entries, (current[0], file_state(self.journal_path, size=end))
+
+    def load(self):
+        return load_requisitions(self.file_path, self.journal_path)
+
+    def read_warm_start(self):
+        """ The stages of read_warm_start, or none if the file no longer matches log_data.xml """
+        stages = read_warm_start(self.warm_path)
+        header = next(stages, None)
+        if header is None:
+            return
+        signature, pending = header
+        current = self.signature()
+        # The journal may have grown since, the index reads that part after the first paint
+        if current[0] != signature[0] or not (current[1] == signature[1] or
+                                              appended_since(self.journal_path, signature[1], current[1])):
+            log.info("Warm start file is older than %s, loading it in full", self.file_path)
+            return
+        yield header
+        yield from stages
+
+    def write_warm_start(self, requisitions, signature):
+        write_warm_start(self.warm_path, requisitions, signature)
+
+    def add(self, requisition):
+        append_journal({"op": "add", "requisition": requisition.to_dict()}, self.journal_path)
+
+    def add_many(self, requisitions):
+        # One journal line for the whole batch, like set_status_many
+        requisitions = list(requisitions)
+        if requisitions:
+            append_journal({"op": "adds", "requisitions": [req.to_dict() for req in requisitions]}, self.journal_path)
+        return len(requisitions)
+
+    def iter_matching(self, **filters):
+        """ Stream requisitions that pass requisition_matches(req, **filters) """
+        return (req for req in iter_log(self.file_path, self.journal_path) if requisition_matches(req, **filters))
+
+    def write_batch(self, requisitions, changes):
+        """ Additions plus status changes (journal-style dicts with their own Status) as one journal line.
+
+        Returns the changes that lost to another station's, which for the
+        journal is none yet: the journal order settles that when it is read.
+        """
+        append_journal({"op": "batch", "requisitions": [req.to_dict() for req in requisitions],
+                        "changes": list(changes)}, self.journal_path)
+        return []
+
+    def set_status(self, record, status, version):
+        # Conflicting changes are settled when the journal is read, see apply_status_change
+        append_journal({
+            "op": "status",
+            "ID": record.id,
+            "Requester": record.requester,
+            "Date": record.date,
+            "Status": str(status),
+            "Version": version,
+        }, self.journal_path)
+
+    def set_status_many(self, changes, status):
+        # One journal line for the whole batch, so a crash applies all of it or none of it
+        append_journal({
+            "op": "statuses",
+            "Status": str(status),
+            "changes": [{"ID": record.id, "Requester": record.requester, "Date": record.date, "Version": version}
+                        for record, version in changes],
+        }, self.journal_path)
+
+    def compact(self):
+        # Archiving folds the journal in as well, so only compact on its own when there was nothing to move
+        try:
+            if ARCHIVE_AFTER_DAYS and archive_completed(self.file_path, self.journal_path, self.archive_dir,
+                                                        warm_path=self.warm_path):
+                return True
+        except Exception as e:
+            # A damaged log, the lock held too long or a full share: leave it all for the next close
+            log.error("Error archiving completed requisitions: %s", e)
+            return False
+        return compact_journal(self.file_path, self.journal_path, self.warm_path)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requisitions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL,
+    requester TEXT,
+    date TEXT,
+    status TEXT,
+    department TEXT,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS items (
+    requisition_seq INTEGER NOT NULL REFERENCES requisitions(seq) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT,
+    quantity TEXT,
+    PRIMARY KEY (requisition_seq, position)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS requisitions_id ON requisitions(id);
+CREATE INDEX IF NOT EXISTS requisitions_status ON requisitions(status);
+CREATE INDEX IF NOT EXISTS requisitions_department ON requisitions(department, status);
+CREATE INDEX IF NOT EXISTS requisitions_requester ON requisitions(requester);
+CREATE INDEX IF NOT EXISTS requisitions_date ON requisitions(date);
+"""
+
+
+class SqliteStorage:
+    """ Requisitions kept in a SQLite database, one row per requisition and per item """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DATABASE_FILE
+        self.key = ('sqlite', self.db_path)
+        self.path = self.db_path
+        # The I/O worker thread uses the connection too, the lock keeps it to one thread at a time
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(self.db_path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SQLITE_SCHEMA)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(requisitions)")}
+        if 'version' not in columns:  # Databases made before versions existed
+            with self.connection:
+                self.connection.execute("ALTER TABLE requisitions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def signature(self, previous=None):
+        # data_version only moves when another connection commits, which is exactly what we need to know
+        with self.lock:
+            return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def read_appended(self, previous, current):
+        return None  # data_version says that something changed, not what
+
+    def read_warm_start(self):
+        return iter(())  # Loading from the database is already the fast path
+
+    def write_warm_start(self, requisitions, signature):
+        pass
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM requisitions LIMIT 1").fetchone() is None
+
+    def fetch(self, where="", params=()):
+        with self.lock, metrics.span('sqlite.load'):
+            return self.fetch_locked(where, params)
+
+    def fetch_locked(self, where, params):
+        rows = self.connection.execute(
+            f"SELECT seq, id, requester, date, status, department, version FROM requisitions {where} ORDER BY seq", params
+        ).fetchall()
+        items = {}
+        for seq, name, quantity in self.connection.execute(
+            f"SELECT requisition_seq, name, quantity FROM items WHERE requisition_seq IN "
+            f"(SELECT seq FROM requisitions {where}) ORDER BY requisition_seq, position", params
+        ):
+            items.setdefault(seq, []).append(make_line_item(name, quantity))
+        return [Requisition(
+            id=req_id,
+            requester=intern_text(requester),
+            date=date or '',
+            status=Status.parse(status),
+            department=intern_text(department),
+            items=items.get(seq, []),
+            version=version,
+        ) for seq, req_id, requester, date, status, department, version in rows]
+
+    def load(self):
+        return self.fetch()
+
+    def insert(self, requisition, ignore_existing=False):
+        verb = "INSERT OR IGNORE" if ignore_existing else "INSERT"
+        cursor = self.connection.execute(
+            f"{verb} INTO requisitions (id, requester, date, status, department, version) VALUES (?, ?, ?, ?, ?, ?)",
+            (requisition.id, requisition.requester, requisition.date,
+             str(requisition.status), requisition.department, requisition.version)
+        )
+        if cursor.rowcount == 0:
+            return False
+        self.connection.executemany(
+            "INSERT INTO items (requisition_seq, position, name, quantity) VALUES (?, ?, ?, ?)",
+            [(cursor.lastrowid, position, name, quantity)
+             for position, (name, quantity) in enumerate(requisition.items)]
+        )
+        return True
+
+    def add(self, requisition):
+        with self.lock, metrics.span('storage.write'), self.connection:
+            self.insert(requisition)
+
+    def iter_matching(self, text=None, status=None, department=None, date_from=None, date_to=None, page_size=1000):
+        """ Stream requisitions a page at a time, with everything but text filtered in SQL on the indexed columns """
+        conditions = []
+        params = []
+        # Dates compare as prefixes, the same as requisition_matches
+        for column, operator, value in (('status', '=', status), ('department', '=', department),
+                                        ('substr(date, 1, ?)', '>=', date_from), ('substr(date, 1, ?)', '<=', date_to)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.extend([len(value), value] if column.startswith('substr') else [value])
+        last_seq = 0
+        while True:
+            with self.lock:
+                seqs = [seq for seq, in self.connection.execute(
+                    f"SELECT seq FROM requisitions WHERE {' AND '.join(conditions + ['seq > ?'])} ORDER BY seq LIMIT ?",
+                    params + [last_seq, page_size])]
+                if not seqs:
+                    return
+                page = self.fetch_locked(f"WHERE {' AND '.join(conditions + ['seq BETWEEN ? AND ?'])}",
+                                         params + [seqs[0], seqs[-1]])
+            last_seq = seqs[-1]
+            yield from (req for req in page if requisition_matches(req, text))
+
+    def add_many(self, requisitions):
+        """ Insert in one transaction, skipping IDs that are already stored """
+        with self.lock, self.connection:
+            return sum(self.insert(requisition, ignore_existing=True) for requisition in requisitions)
+
+    def write_batch(self, requisitions, changes):
+        """ Additions plus status changes (journal-style dicts with their own Status) in one transaction.
+
+        A change to a row another station already took past its version is
+        left out and returned as (change, stored status, stored version).
+        """
+        lost = []
+        with self.lock, metrics.span('storage.write'), self.connection:
+            for requisition in requisitions:
+                self.insert(requisition, ignore_existing=True)
+            for change in changes:
+                cursor = self.connection.execute(
+                    "UPDATE requisitions SET status = ?, version = ? WHERE id = ? AND version < ?",
+                    (change['Status'], change['Version'], change['ID'], change['Version']))
+                if cursor.rowcount == 0:
+                    row = self.connection.execute(
+                        "SELECT status, version FROM requisitions WHERE id = ?", (change['ID'],)).fetchone()
+                    if row is not None:
+                        lost.append((change, row[0], row[1]))
+        return lost
+
+    def set_status(self, record, status, version):
+        self.set_status_many([(record, version)], status)
+
+    def set_status_many(self, changes, status):
+        # Only update rows still below the new version; if any was changed elsewhere first, roll all back
+        with self.lock, metrics.span('storage.write'), self.connection:
+            cursor = self.connection.executemany(
+                "UPDATE requisitions SET status = ?, version = ? WHERE id = ? AND version < ?",
+                [(str(status), version, record.id, version) for record, version in changes])
+            if cursor.rowcount < len(changes):
+                raise ConflictError("A requisition was changed at another station first, showing its current state")
+
+    def compact(self):
+        with self.lock:
+            self.connection.execute("PRAGMA optimize")
+        return False
+
+
+class ServiceStorage:
+    """ Requisitions kept in memory by the requisition server (server.py), reached over its JSON API.
+
+    Stations using it never open the log files themselves; the server writes
+    them in batches. The signature is the server's (epoch, version) and
+    read_appended gets the changes since a version in the journal's format.
+    """
+
+    def __init__(self, url=None):
+        self.url = url or SERVER_URL
+        self.key = ('service', self.url)
+        self.path = self.url
+        self.lock = threading.Lock()
+        self.connection = None
+        self.station = uuid.uuid4().hex[:12]  # So the server can tell us which of its corrections undo our changes
+
+    def request(self, method, path, payload=None, **params):
+        """ The decoded JSON reply, None if the server answers 410 Gone """
+        import http.client
+        from urllib.parse import urlencode, urlsplit
+        query = urlencode({name: value for name, value in params.items() if value is not None})
+        body = None if payload is None else json.dumps(payload).encode('utf-8')
+        with self.lock, metrics.span('service.request'):
+            # The connection is kept open between requests; one the server dropped meanwhile is retried once
+            for attempt in range(2):
+                if self.connection is None:
+                    address = urlsplit(self.url)
+                    self.connection = http.client.HTTPConnection(address.hostname, address.port or 80,
+                                                                 timeout=LOCK_TIMEOUT)
+                try:
+                    self.connection.request(method, f"{path}?{query}" if query else path, body,
+                                            {'Content-Type': 'application/json'})
+                    response = self.connection.getresponse()
+                    data = json.loads(response.read() or b'null')
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    self.connection.close()
+                    self.connection = None
+                    if attempt:
+                        raise
+        if response.status == 409:
+            raise ConflictError(data.get('error'))
+        if response.status == 410:
+            return None
+        if response.status >= 400:
+            raise OSError(f"{method} {path} failed on {self.url}: {data.get('error')}")
+        return data
+
+    def signature(self, previous=None):
+        state = self.request('GET', '/state')
+        return state['epoch'], state['version']
+
+    def read_appended(self, previous, current):
+        # A new epoch means the server reloaded from its storage, and so must we
+        if previous is None or previous[0] != current[0]:
+            return None
+        data = self.request('GET', '/changes', since=previous[1], epoch=previous[0])
+        if data is None:
+            return None  # Older than the server still remembers
+        for entry in data['entries']:
+            if entry.get('op') == 'corrections':
+                for change in entry['changes']:
+                    change['mine'] = change.get('Station') == self.station
+        return data['entries'], (data['epoch'], data['version'])
+
+    def load(self):
+        return list(self.iter_matching())
+
+    def read_warm_start(self):
+        return iter(())  # The server already holds the parsed log
+
+    def write_warm_start(self, requisitions, signature):
+        pass
+
+    def add(self, requisition):
+        self.add_many([requisition])
+
+    def add_many(self, requisitions):
+        requisitions = list(requisitions)
+        if requisitions:
+            self.request('POST', '/requisitions', [req.to_dict() for req in requisitions])
+        return len(requisitions)
+
+    def iter_matching(self, **filters):
+        data = self.request('GET', '/requisitions', **filters)
+        return (Requisition.from_dict(item) for item in data['requisitions'])
+
+    def set_status(self, record, status, version):
+        self.set_status_many([(record, version)], status)
+
+    def set_status_many(self, changes, status):
+        # The server turns away the whole batch if any of them was changed elsewhere first, like SQLite
+        self.request('POST', '/status', {
+            "Status": str(status),
+            "Station": self.station,
+            "changes": [{"ID": record.id, "Requester": record.requester, "Date": record.date, "Version": version}
+                        for record, version in changes],
+        })
+
+    def compact(self):
+        return False  # The server compacts the storage it owns when it stops
+
+
+def migrate_xml_to_sqlite(file_path=None, journal_path=None, db_path=None):
+    """ Copy everything in log_data.xml and its journal into the SQLite database """
+    source = XmlJournalStorage(file_path, journal_path)
+    target = SqliteStorage(db_path)
+    count = target.add_many(source.load())
+    log.info("Migrated %s requisitions from %s to %s", count, source.file_path, target.db_path)
+    return count
+
+
+def export_xml(file_path, storage=None):
+    """ Write whatever the storage holds out as a log_data.xml style file """
+    storage = storage or get_storage()
+    write_snapshot(storage.load(), file_path)
+
+
+_storages = {}
+
+def get_storage(backend=None):
+    backend = backend or STORAGE_BACKEND
+    if backend not in _storages:
+        if backend == 'sqlite':
+            storage = SqliteStorage()
+            if storage.is_empty() and os.path.exists(LOG_DATA_FILE):
+                storage.add_many(XmlJournalStorage().load())  # First run on SQLite, bring the XML history across
+        elif backend == 'service':
+            storage = ServiceStorage()
+        else:
+            storage = XmlJournalStorage()
+        _storages[backend] = storage
+    return _storages[backend]
+
+
+class IOWorker:
+    """ Background thread that does the storage reads and writes for the Tk window.
+
+    Work queued with submit() runs in order on a single thread, so the storage
+    never sees two operations at once. Results and errors are handed back on
+    the Tk thread by polling with root.after. Queued work that shares a
+    coalesce_key collapses into the newest one, so a burst of writes to the
+    same requisition only hits the disk once.
+    """
+
+    def __init__(self, root, on_error=None):
+        self.root = root
+        self.on_error = on_error
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="requisition-io", daemon=True)
+        self.thread.start()
+        self.root.after(IO_POLL_MS, self.poll)
+
+    def submit(self, work, on_done=None, on_error=None, coalesce_key=None):
+        self.tasks.put((work, on_done, on_error, coalesce_key))
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.tasks.get()]
+            while True:
+                try:
+                    batch.append(self.tasks.get_nowait())
+                except queue.Empty:
+                    break
+
+            newest = {task[3]: position for position, task in enumerate(batch)
+                      if task is not None and task[3] is not None}
+            superseded = {}
+            for position, task in enumerate(batch):
+                if task is None:
+                    stopping = True
+                    continue
+                work, on_done, on_error, coalesce_key = task
+                if coalesce_key is not None and newest[coalesce_key] != position:
+                    # A newer write for the same thing is right behind this one, it reports for both
+                    superseded.setdefault(coalesce_key, []).append(on_done)
+                    continue
+                try:
+                    result = work()
+                except Exception as e:
+                    self.results.put((None, None, on_error, e))
+                    continue
+                for callback in superseded.pop(coalesce_key, []) + [on_done]:
+                    self.results.put((callback, result, None, None))
+
+    def poll(self):
+        while True:
+            try:
+                on_done, result, on_error, error = self.results.get_nowait()
+            except queue.Empty:
                 break
-        # If ID doesn't exist or doesn't match, fall back to the original method
-        elif (req.find('Requester').text == updated_req['Requester'] and
-              req.find('Date').text == updated_req['Date']):
-            req.find('Status').text = updated_req['Status']
-            break
+            if error is not None:
+                handler = on_error or self.on_error
+                if handler:
+                    handler(error)
+                else:
+                    log.error("Background I/O failed: %s", error)
+            elif on_done:
+                on_done(result)
+        self.root.after(IO_POLL_MS, self.poll)
+
+    def stop(self, timeout=None):
+        """ Finish everything that is queued, then let the thread end """
+        self.tasks.put(None)
+        self.thread.join(timeout)
+
+
+@dataclass(slots=True, eq=False)
+class ItemHistory:
+    """ Last order and running totals of one stock item, overall or for one department """
+    name: str
+    last_date: str = ''
+    last_quantity: object = None
+    last_requester: str = ''
+    last_department: str = ''
+    orders: int = 0
+    total_quantity: int = 0  # Only quantities that are plain numbers add up
+
+    def record(self, req, quantity):
+        self.orders += 1
+        if isinstance(quantity, int):
+            self.total_quantity += quantity
+        if req.date >= self.last_date:
+            self.last_date = req.date
+            self.last_quantity = quantity
+            self.last_requester = req.requester
+            self.last_department = req.department
+
+    def describe(self):
+        return (f"Last: {self.last_quantity} on {self.last_date[:10]} by {self.last_requester}"
+                f" ({self.total_quantity} over {self.orders} order{'s' if self.orders != 1 else ''})")
+
+
+def history_key(name):
+    # Stock names come padded from the CSV export, custom items however they were typed
+    return name.strip().casefold()
+
+
+class OrderHistory:
+    """ Per item and per department order history, so "what did we order last time" is a dict lookup """
+
+    def __init__(self):
+        self.items = {}
+        self.departments = {}
+
+    @classmethod
+    @metrics.timed('history.build')
+    def build(cls, requisitions):
+        history = cls()
+        for req in requisitions:
+            history.record(req)
+        return history
+
+    def record(self, req):
+        by_department = self.departments.setdefault(req.department, {})
+        for name, quantity in req.items:
+            key = history_key(name)
+            if not key:
+                continue
+            for table in (self.items, by_department):
+                entry = table.get(key)
+                if entry is None:
+                    entry = table[key] = ItemHistory(name.strip())
+                entry.record(req, quantity)
+
+    def last_ordered(self, name, department=None):
+        """ ItemHistory of name, for one department if given, or None if it was never ordered """
+        table = self.items if department is None else self.departments.get(department, {})
+        return table.get(history_key(name))
+
+    def department_items(self, department, limit=None):
+        """ What a department orders, most recently ordered first """
+        entries = self.departments.get(department, {}).values()
+        if limit is None:
+            return sorted(entries, key=lambda entry: entry.last_date, reverse=True)
+        return heapq.nlargest(limit, entries, key=lambda entry: entry.last_date)
+
+
+def search_tokens(text):
+    return re.findall(r'\w+', (text or '').casefold())
+
+
+class SearchIndex:
+    """ Inverted index from words of the ID, requester, department and item names to requisitions.
+
+    Every query word matches indexed words that start with it, whole words
+    scoring higher than prefixes, and a requisition has to match all of them.
+    Status and dates are checked on the matches only, so status changes need
+    no index update.
+    """
+
+    FIELD_WEIGHTS = (('id', 8), ('requester', 4), ('department', 2))
+    ITEM_WEIGHT = 1
+
+    def __init__(self):
+        self.postings = {}  # word -> {requisition id: weight}
+        self.words = []  # Sorted, for prefix lookups
+        self.requisitions = {}
+
+    @classmethod
+    @metrics.timed('search.build')
+    def build(cls, requisitions):
+        index = cls()
+        postings = index.postings
+        for req in requisitions:
+            index.requisitions[req.id] = req
+            for word, weight in index.weighted_words(req):
+                posting = postings.setdefault(word, {})
+                posting[req.id] = posting.get(req.id, 0) + weight
+        index.words = sorted(postings)
+        return index
+
+    def weighted_words(self, req):
+        for attribute, weight in self.FIELD_WEIGHTS:
+            for word in search_tokens(getattr(req, attribute)):
+                yield word, weight
+        for name, _ in req.items:
+            for word in search_tokens(name):
+                yield word, self.ITEM_WEIGHT
+
+    def add(self, req):
+        self.requisitions[req.id] = req
+        for word, weight in self.weighted_words(req):
+            posting = self.postings.get(word)
+            if posting is None:
+                posting = self.postings[word] = {}
+                bisect.insort(self.words, word)
+            posting[req.id] = posting.get(req.id, 0) + weight
+
+    def expand(self, term):
+        start = bisect.bisect_left(self.words, term)
+        for word in itertools.islice(self.words, start, None):
+            if not word.startswith(term):
+                break
+            yield word
+
+    def term_scores(self, term):
+        scores = {}
+        for word in self.expand(term):
+            factor = 1.0 if word == term else 0.5
+            for req_id, weight in self.postings[word].items():
+                score = weight * factor
+                if score > scores.get(req_id, 0):
+                    scores[req_id] = score
+        return scores
+
+    @metrics.timed('search.query')
+    def search(self, text, status=None, date_from=None, date_to=None, limit=None):
+        """ Requisitions matching every word of text, best match first, newest first among equals """
+        scores = None
+        for term in sorted(set(search_tokens(text)), key=len, reverse=True):  # Longest words narrow it down fastest
+            found = self.term_scores(term)
+            if scores is not None:
+                found = {req_id: score + found[req_id] for req_id, score in scores.items() if req_id in found}
+            scores = found
+            if not scores:
+                return []
+
+        if scores is None:
+            candidates = ((0, req) for req in self.requisitions.values())
+        else:
+            candidates = ((score, self.requisitions[req_id]) for req_id, score in scores.items())
+        matches = [(score, req.date, req) for score, req in candidates
+                   if requisition_matches(req, None, status, None, date_from, date_to)]
+        if limit:
+            matches = heapq.nlargest(limit, matches, key=lambda match: match[:2])
+        else:
+            matches.sort(key=lambda match: match[:2], reverse=True)
+        return [req for _, _, req in matches]
+
+
+@dataclass(slots=True, eq=False)
+class OrderLine:
+    """ One line of a purchase order: an item, for one department or all of them """
+    name: str
+    department: str = ''
+    quantity: int = 0
+    other_quantities: dict = field(default_factory=dict)  # Quantities that are not plain numbers -> times asked
+    orders: int = 0  # Pending line items that asked for it
+    in_stock: bool = True
+
+    def add(self, quantity, sign=1):
+        self.orders += sign
+        if isinstance(quantity, int):
+            self.quantity += sign * quantity
+        elif quantity:
+            count = self.other_quantities.get(quantity, 0) + sign
+            if count:
+                self.other_quantities[quantity] = count
+            else:
+                del self.other_quantities[quantity]
+
+    def merge(self, other):
+        self.orders += other.orders
+        self.quantity += other.quantity
+        for quantity, count in other.other_quantities.items():
+            self.other_quantities[quantity] = self.other_quantities.get(quantity, 0) + count
+
+
+class PendingOrders:
+    """ Every Pending line item added up per item and department.
+
+    It remembers which requisitions it has counted, so update() can be handed
+    any requisitions whose status may have changed and only adds or takes away
+    the ones that went to or from Pending.
+    """
+
+    def __init__(self):
+        self.lines = {}  # (item key, department) -> OrderLine
+        self.counted = set()
+
+    @classmethod
+    @metrics.timed('orders.build')
+    def build(cls, requisitions):
+        orders = cls()
+        orders.update(requisitions)
+        return orders
+
+    def update(self, requisitions):
+        for req in requisitions:
+            pending = req.status == Status.PENDING
+            if pending == (req.id in self.counted):
+                continue
+            if pending:
+                self.counted.add(req.id)
+            else:
+                self.counted.discard(req.id)
+            sign = 1 if pending else -1
+            for name, quantity in req.items:
+                key = (history_key(name), req.department)
+                line = self.lines.get(key)
+                if line is None:
+                    line = self.lines[key] = OrderLine(name.strip(), req.department)
+                line.add(quantity, sign)
+                if not line.orders:
+                    del self.lines[key]
+
+    def purchase_order(self, stock_items=None, by_department=False):
+        """ OrderLines sorted by department and item, with in_stock set against stock_items if given """
+        lines = {}
+        for (item_key, department), line in self.lines.items():
+            key = (item_key, department) if by_department else item_key
+            total = lines.get(key)
+            if total is None:
+                total = lines[key] = OrderLine(line.name, department if by_department else '')
+            total.merge(line)
+        if stock_items is not None:
+            stock_names = {history_key(name) for name in stock_items}
+            for total in lines.values():
+                total.in_stock = history_key(total.name) in stock_names
+        return sorted(lines.values(), key=lambda line: (line.department, line.name.casefold()))
+
+
+PURCHASE_ORDER_COLUMNS = ["Item", "Department", "Quantity", "Other Quantities", "Orders", "Note"]
+
+
+def purchase_order_rows(lines):
+    """ Rows for PURCHASE_ORDER_COLUMNS, shared by the window and the CSV export """
+    for line in lines:
+        note = "" if line.in_stock else "Not in stock list"
+        others = "; ".join(f"{quantity} x{count}" if count > 1 else quantity
+                           for quantity, count in line.other_quantities.items())
+        yield [line.name, line.department, line.quantity or "", others, line.orders, note]
+
+
+def write_purchase_order(f, lines):
+    writer = csv.writer(f)
+    writer.writerow(PURCHASE_ORDER_COLUMNS)
+    writer.writerows(purchase_order_rows(lines))
+
+
+def build_lookups(requisitions):
+    """ Everything the index derives from the requisitions, built together when they are loaded """
+    return OrderHistory.build(requisitions), SearchIndex.build(requisitions), PendingOrders.build(requisitions)
+
+
+class RequisitionIndex:
+    """ In-memory ID -> requisition index over one of the storages.
+
+    With a worker attached the index is updated straight away and the storage
+    is written and reloaded on the worker thread; without one (scripts, tests)
+    every call goes to the storage directly.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.worker = None
+        self.requisitions = []
+        self.by_id = {}
+        self.by_key = {}
+        self.history = OrderHistory()
+        self.search = SearchIndex()
+        self.orders = PendingOrders()
+        self.signature = None
+        self.listeners = []
+        self.pending_writes = 0
+        self.stale = False
+        self.refreshing = False
+        self.suspects = {}  # id -> status we set, for changes that may have lost to another station's
+
+    def subscribe(self, listener):
+        """ listener(event, req=None, old_status=None) is called after every change.
+
+        Events are 'reloaded', 'added' and 'status' for one requisition, and
+        'statuses', 'merged' (other stations' changes) and 'conflict' (our
+        changes that lost to another station's) with a list of them. On a
+        warm start 'preview' comes first with the Pending requisitions only.
+        """
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, event, req=None, old_status=None):
+        for listener in list(self.listeners):  # A listener may unsubscribe while being told
+            listener(event, req, old_status)
+
+    def current_signature(self):
+        return self.storage.signature(self.signature)
+
+    @metrics.timed('index.build')
+    def apply_load(self, requisitions, signature, lookups=None):
+        self.requisitions = requisitions
+        self.by_id = {req.id: req for req in self.requisitions}
+        self.by_key = {req.key: req for req in self.requisitions}
+        self.history, self.search, self.orders = lookups or build_lookups(requisitions)
+        self.signature = signature
+        self.notify('reloaded')
+        lost = [self.by_id[req_id] for req_id, status in self.suspects.items()
+                if req_id in self.by_id and self.by_id[req_id].status != status]
+        self.suspects = {}
+        if lost:
+            log.warning("%s requisitions were changed at another station at the same time", len(lost))
+            self.notify('conflict', lost)
+
+    def rebuild(self):
+        signature = self.storage.signature()
+        self.apply_load(self.storage.load(), signature)
+
+    def validate(self):
+        """ Load only what the storage gained since we last looked, if anything """
+        if self.worker is not None:
+            self.refresh_async()
+        else:
+            self.loaded(self.read_changes(self.signature))
+        return self
+
+    def warm_start(self):
+        """ First load with a worker: Pending from the warm start file as soon as that is read, then the rest """
+        self.refreshing = True
+        stages = self.storage.read_warm_start()
+        header = []
+
+        def read_header():
+            header.extend(itertools.islice(stages, 1))
+            return header[0] if header else None
+
+        def read_rest():
+            requisitions = next(stages, None) if header else None
+            if requisitions is None:
+                result = self.read_changes(None)
+                # Queued behind this read, so the window fills in before the file is written
+                self.worker.submit(lambda: self.storage.write_warm_start(result[1], result[2]))
+                return result
+            return 'reloaded', requisitions, header[0][0], build_lookups(requisitions)
+
+        self.worker.submit(read_header, on_done=self.preview_loaded, on_error=self.refresh_failed)
+        self.worker.submit(read_rest, on_done=self.warm_loaded, on_error=self.refresh_failed)
+        return self
+
+    def preview_loaded(self, header):
+        if header is not None and not self.requisitions:
+            self.notify('preview', header[1])
+
+    def warm_loaded(self, result):
+        self.loaded(result)
+        self.refresh_async()  # Whatever the journal gained since the warm start file was written
+
+    def read_changes(self, previous):
+        """ None if nothing changed, ('appended', entries, signature) if other stations only
+        added to the journal, else ('reloaded', requisitions, signature, lookups) """
+        signature = self.storage.signature(previous)
+        if signature == previous:
+            return None
+        appended = self.storage.read_appended(previous, signature)
+        if appended is not None:
+            entries, signature = appended
+            return 'appended', entries, signature
+        requisitions = self.storage.load()
+        return 'reloaded', requisitions, signature, build_lookups(requisitions)
+
+    def refresh_async(self):
+        if self.pending_writes:
+            self.stale = True  # Reload once our own writes have landed
+            return
+        if self.refreshing:
+            return  # The periodic check and an explicit refresh can meet, one read is enough
+        self.refreshing = True
+        previous = self.signature
+        self.worker.submit(lambda: self.read_changes(previous), on_done=self.loaded, on_error=self.refresh_failed)
+
+    def refresh_failed(self, error):
+        self.refreshing = False
+        log.error("Error reading requisitions: %s", error)
+
+    def loaded(self, result):
+        self.refreshing = False
+        if self.pending_writes:
+            self.stale = True
+        elif result is None:
+            pass
+        elif result[0] == 'appended':
+            self.apply_appended(*result[1:])
+        else:
+            self.apply_load(*result[1:])
+
+    def apply_appended(self, entries, signature):
+        """ Merge journal entries written by other stations, then tell listeners what they changed """
+        added = []
+        changed = []
+        conflicts = []
+        lost = []
+        for entry in entries:
+            if entry.get('op') == 'corrections':
+                # The requisition server saying what its storage really holds, 'mine' where ours lost to it
+                for change in entry['changes']:
+                    record = find_change_target(self.by_id, self.by_key, change)
+                    if record is None:
+                        continue
+                    record.status, record.version = Status.parse(change['Status']), change.get('Version', 0)
+                    changed.append(record)
+                    if change.get('mine'):
+                        lost.append(record)
+                continue
+            for data in journal_additions(entry):
+                requisition = Requisition.from_dict(data)
+                if requisition.id not in self.by_id:
+                    self.insert(requisition)
+                    added.append(requisition)
+            for change in journal_changes(entry):
+                status = Status.parse(change_status(entry, change))
+                record = find_change_target(self.by_id, self.by_key, change)
+                if record is None:
+                    continue
+                old_status = record.status
+                if apply_status_change(self.by_id, self.by_key, change, status):
+                    if record.status != old_status:
+                        changed.append(record)
+                elif record.status != status:
+                    conflicts.append(record)
+        metrics.count('journal.tail_records', len(entries))
+        if conflicts:
+            # Another station changed these from the version we changed them from. The journal order
+            # decides who won, so read it all again and see if our change survived.
+            self.suspects.update((record.id, record.status) for record in conflicts)
+            self.signature = None
+            if self.worker is not None:
+                self.refresh_async()
+            else:
+                self.rebuild()
+            return
+        self.signature = signature
+        self.orders.update(changed)
+        if added or changed:
+            self.notify('merged', added + changed)
+        if lost:
+            log.warning("%s requisitions were changed at another station at the same time", len(lost))
+            self.notify('conflict', lost)
+
+    def persist(self, work, coalesce_key=None):
+        def write():
+            # What the storage looked like just before our write tells us if another station got in first
+            before = self.storage.signature()
+            work()
+            return before, self.storage.signature()
+
+        if self.worker is None:
+            self.written(write(), queued=False)
+            return
+        self.pending_writes += 1
+        self.worker.submit(write, on_done=self.written, on_error=self.write_failed, coalesce_key=coalesce_key)
+
+    def written(self, result, queued=True):
+        before, after = result
+        if queued:
+            self.pending_writes -= 1
+        if self.signature in (before, after):
+            self.signature = after
+        else:
+            self.stale = True  # Someone else wrote too, keep our old signature so their part gets read
+        if not self.pending_writes and self.stale:
+            self.stale = False
+            if self.worker is not None:
+                self.refresh_async()
+
+    def write_failed(self, error):
+        # Forget what we thought was stored and show what really is
+        self.pending_writes = 0
+        self.stale = False
+        self.signature = None
+        self.refresh_async()
+        if self.worker.on_error:
+            self.worker.on_error(error)
+        else:
+            log.error("Error saving requisitions: %s", error)
+
+    def find(self, req):
+        found = self.by_id.get(req.id)
+        if found is None:
+            found = self.by_key.get(req.key)
+        return found
+
+    def insert(self, requisition):
+        self.requisitions.append(requisition)
+        self.by_id[requisition.id] = requisition
+        self.by_key[requisition.key] = requisition
+        self.history.record(requisition)
+        self.search.add(requisition)
+        self.orders.update([requisition])
+
+    def add(self, requisition):
+        # The record can change before a queued write runs, so write it as it is now
+        snapshot = requisition.copy()
+        self.persist(lambda: self.storage.add(snapshot))
+        if requisition.id not in self.by_id:
+            self.insert(requisition)
+        self.notify('added', requisition)
+
+    def add_many(self, requisitions):
+        """ Add the requisitions not already here with one storage write, returning them """
+        new = {}
+        for requisition in requisitions:
+            if requisition.id not in self.by_id:
+                new.setdefault(requisition.id, requisition)
+        new = list(new.values())
+        if not new:
+            return []
+        snapshots = [requisition.copy() for requisition in new]
+        self.persist(lambda: self.storage.add_many(snapshots))
+        for requisition in new:
+            self.insert(requisition)
+        self.notify('merged', new)
+        return new
+
+    def set_status(self, req, status):
+        record = self.find(req)
+        if record is None:
+            return None
+        status = Status.parse(status)
+        version = record.version + 1
+        self.persist(lambda: self.storage.set_status(record, status, version), coalesce_key=('status', record.id))
+        old_status, record.status, record.version = record.status, status, version
+        self.orders.update([record])
+        self.notify('status', record, old_status)
+        return record
+
+    def set_status_many(self, reqs, status):
+        """ Change many statuses with one storage write and one 'statuses' event """
+        status = Status.parse(status)
+        records = [record for record in map(self.find, reqs) if record is not None and record.status != status]
+        if not records:
+            return []
+        changes = [(record, record.version + 1) for record in records]
+        self.persist(lambda: self.storage.set_status_many(changes, status))
+        for record, version in changes:
+            record.status = status
+            record.version = version
+        self.orders.update(records)
+        self.notify('statuses', records)
+        return records
+
+
+_indexes = {}
+
+def get_requisition_index(storage=None, validate=True):
+    storage = storage or get_storage()
+    if storage.key not in _indexes:
+        _indexes[storage.key] = RequisitionIndex(storage)
+    index = _indexes[storage.key]
+    return index.validate() if validate else index
+
+
+def save_to_xml(requisition):
+    if not requisition.id:
+        requisition.id = str(uuid.uuid4())[:8]  # Use first 8 characters of a UUID
+
+    try:
+        index = get_requisition_index()
+        index.add(requisition)
+        log.info("Requisition saved to %s", index.storage.path)
+        return True
+    except Exception as e:
+        log.error("Error saving requisition: %s", e)
+        return False
+
+def update_xml_status(updated_req,):
+    index = get_requisition_index()
+    record = index.set_status(updated_req, updated_req.status)
+    if record is None:
+        log.warning("Requisition %s not found in %s", updated_req.id, index.storage.path)
+        return False
+    log.info("Requisition status updated to %s in %s", updated_req.status, index.storage.path)
+    return True
+
+def update_xml_statuses(updated_reqs, status):
+    index = get_requisition_index()
+    records = index.set_status_many(updated_reqs, status)
+    log.info("%s requisitions updated to %s in %s", len(records), status, index.storage.path)
+    return records
 
-    tree.write(file_path, encoding="utf-8", xml_declaration=True)
-    print(f"Requisition status updated to {updated_req['Status']} in {file_path}")
+def last_ordered(item, department=None):
+    """ When item was last ordered, by whom and how much, without rescanning the log """
+    return get_requisition_index().history.last_ordered(item, department)
 
 if __name__ == "__main__":
-    stock_items = load_stock_items()
-    main_menu = MainMenu(stock_items)
+    import multiprocessing
+    multiprocessing.freeze_support()  # Archive searches use a process pool, also in the PyInstaller build
+    configure_logging()
+    main_menu = MainMenu()  # Stock items are read on the I/O thread once the window is up
     main_menu.run()
@@ -0,0 +1,379 @@
+"""
+Local requisition server, so every station shares one copy of the log in memory.
+
+Stations started with REQUISITION_STORAGE=service (and REQUISITION_SERVER if
+it is not on this machine) read and write through this process instead of
+each parsing and rewriting log_data.xml. Reads are answered from memory.
+Writes are applied at once and saved to the real storage (REQUISITION_STORAGE,
+or --storage) in one batch every --flush-seconds.
+
+    python server.py
+    python server.py --host 0.0.0.0 --port 8765 --storage sqlite --flush-seconds 2
+
+The API is JSON over HTTP, with requisitions in the journal's format:
+
+    GET  /state                      {"epoch": ..., "version": ...}
+    GET  /requisitions               {"epoch", "version", "requisitions": [...]}, filtered by
+                                     ?status= &department= &date_from= &date_to= &text=
+    GET  /changes?epoch=E&since=N    {"epoch", "version", "entries": [...]} made after version N,
+                                     410 if the epoch changed or N is older than the server remembers
+    POST /requisitions               [requisition, ...], those whose ID is already there are skipped
+    POST /status                     {"Status": ..., "Station": ..., "changes": [{"ID": ..., "Version": ...}, ...]},
+                                     409 and nothing changed if one of them was changed first
+
+Changes another program made to the storage directly show up in /changes as
+well, when the server next reads it. Where one of those got to a requisition
+before a change made through the API was saved, theirs stands, and the server
+says so with a "corrections" entry: the stored Status and Version of each
+requisition, with the Station whose change was undone. The epoch changes only
+when that cannot be said with entries, for example when requisitions were
+removed by an archive.
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import uuid
+from urllib.parse import parse_qsl, urlsplit
+
+import requisition
+
+FEED_LIMIT = 10000  # Changes kept for /changes; a station further behind than this loads everything again
+MAX_BODY = 64 * 1024 * 1024
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 410: "Gone",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def write_entries(storage, entries):
+    """ Save a batch of API changes in one write, with each requisition's last change.
+
+    Returns the changes that lost to one made directly in the storage, as (change, status, version)
+    """
+    added = {}
+    latest = {}
+    for entry in entries:
+        for data in requisition.journal_additions(entry):
+            added.setdefault(data["ID"], data)
+        for change in requisition.journal_changes(entry):
+            latest[change["ID"]] = {"ID": change["ID"], "Requester": change.get("Requester"),
+                                    "Date": change.get("Date"), "Version": change["Version"],
+                                    "Status": requisition.change_status(entry, change)}
+    return storage.write_batch([requisition.Requisition.from_dict(data) for data in added.values()],
+                               list(latest.values()))
+
+
+def journal_differences(before, requisitions):
+    """ (added, changed) between two loads, or None if something besides status and version changed """
+    added = []
+    changed = []
+    for req in requisitions:
+        old = before.get(req.id)
+        if old is None:
+            added.append(req)
+        elif (old.requester, old.date, old.department, list(old.items)) != (req.requester, req.date,
+                                                                             req.department, list(req.items)):
+            return None
+        elif (old.status, old.version) != (req.status, req.version):
+            changed.append(req)
+    if len(requisitions) - len(added) != len(before):
+        return None  # Some were removed
+    return added, changed
+
+
+class RequisitionService:
+    """ The requisitions of one storage in memory, plus the changes made through the API since the last load """
+
+    def __init__(self, storage, flush_seconds=1.0):
+        self.storage = storage
+        self.flush_seconds = flush_seconds
+        self.index = requisition.RequisitionIndex(storage)
+        # API writes change the index directly, so anything it reports came from the storage
+        self.index.subscribe(self.on_storage_changed)
+        self.storage_events = []
+        self.epoch = None
+        self.version = 0
+        self.feed = collections.deque(maxlen=FEED_LIMIT)  # (version, journal entry)
+        self.unsaved = []
+        self.lock = asyncio.Lock()
+        self.address = None
+        self.connections = set()
+
+    def load(self):
+        self.index.rebuild()
+        self.publish({}, {})
+
+    def on_storage_changed(self, event, reqs=None, old_status=None):
+        self.storage_events.append((event, reqs))
+
+    def publish(self, before, stations, corrected=()):
+        """ Put what the index read from the storage in the feed, or start a new epoch if entries can't say it.
+
+        before is by_id from before the read, stations the Station of each ID changed in the last flush.
+        """
+        events, self.storage_events = self.storage_events, []
+        added = []
+        changed = {req.id: req for req in corrected}
+        renew = self.epoch is None
+        for event, reqs in events:
+            if event == 'merged':
+                for req in reqs:
+                    if req.id in before:
+                        changed[req.id] = req
+                    else:
+                        added.append(req)
+            elif event == 'reloaded':
+                differences = journal_differences(before, self.index.requisitions)
+                if differences is None:
+                    renew = True
+                else:
+                    added.extend(differences[0])
+                    changed.update((req.id, req) for req in differences[1])
+        if renew:
+            self.epoch = uuid.uuid4().hex[:12]
+            self.feed.clear()
+            requisition.log.info("Read %s, %s requisitions in epoch %s",
+                                 self.storage.path, len(self.index.requisitions), self.epoch)
+            return
+        if added:
+            self.publish_entry({"op": "adds", "requisitions": [req.to_dict() for req in added]})
+        if changed:
+            self.publish_entry({"op": "corrections", "changes": [
+                {"ID": req.id, "Requester": req.requester, "Date": req.date, "Status": str(req.status),
+                 "Version": req.version, "Station": stations.get(req.id)} for req in changed.values()]})
+
+    def state(self):
+        return {"epoch": self.epoch, "version": self.version}
+
+    def publish_entry(self, entry):
+        self.version += 1
+        self.feed.append((self.version, entry))
+
+    def record(self, entry):
+        self.publish_entry(entry)
+        self.unsaved.append(entry)
+
+    def list_requisitions(self, params):
+        status = params.get("status")
+        filters = {"text": params.get("text"), "status": status and requisition.Status.parse(status),
+                   "department": params.get("department"),
+                   "date_from": params.get("date_from"), "date_to": params.get("date_to")}
+        matches = [req.to_dict() for req in self.index.requisitions if requisition.requisition_matches(req, **filters)]
+        return dict(self.state(), requisitions=matches)
+
+    def changes(self, params):
+        since = int(params.get("since", 0))
+        if params.get("epoch") != self.epoch:
+            raise HTTPError(410, "The server reloaded since, load everything again")
+        if since < self.version and (not self.feed or self.feed[0][0] > since + 1):
+            raise HTTPError(410, f"Changes since version {since} are no longer kept, load everything again")
+        newer = itertools.takewhile(lambda change: change[0] > since, reversed(self.feed))
+        entries = [entry for _, entry in newer][::-1]
+        return dict(self.state(), entries=entries)
+
+    def add(self, items):
+        if not isinstance(items, list):
+            raise HTTPError(400, "Expected a list of requisitions")
+        new = []
+        for data in items:
+            req = requisition.Requisition.from_dict(data)
+            if req.id not in self.index.by_id:
+                self.index.insert(req)
+                new.append(req)
+        if new:
+            self.record({"op": "adds", "requisitions": [req.to_dict() for req in new]})
+        return dict(self.state(), added=len(new))
+
+    def set_status(self, payload):
+        status = requisition.Status(payload["Status"])
+        # Check them all first, so a batch is applied whole or not at all
+        targets = []
+        for change in payload["changes"]:
+            record = requisition.find_change_target(self.index.by_id, self.index.by_key, change)
+            if record is None:
+                raise HTTPError(404, f"Requisition {change.get('ID')} not found")
+            version = change.get("Version") or record.version + 1
+            if version <= record.version:
+                raise HTTPError(409, f"Requisition {record.id} was changed at another station first")
+            targets.append((record, version))
+        for record, version in targets:
+            record.status = status
+            record.version = version
+        self.index.orders.update([record for record, _ in targets])
+        self.record({
+            "op": "statuses",
+            "Status": str(status),
+            "Station": payload.get("Station"),
+            "changes": [{"ID": record.id, "Requester": record.requester, "Date": record.date, "Version": version}
+                        for record, version in targets],
+        })
+        return self.state()
+
+    def write(self, entries):
+        """ Runs on a worker thread; returns the storage signature before and after, and the lost changes """
+        before = self.storage.signature()
+        with requisition.metrics.span('server.flush'):
+            lost = write_entries(self.storage, entries)
+        return before, lost, self.storage.signature()
+
+    async def flush(self):
+        """ Save what the API changed since the last flush, then pick up what others wrote to the storage """
+        async with self.lock:
+            entries, self.unsaved = self.unsaved, []
+            stations = {change["ID"]: entry.get("Station")
+                        for entry in entries for change in requisition.journal_changes(entry)}
+            corrected = []
+            if entries:
+                try:
+                    before, lost, after = await asyncio.to_thread(self.write, entries)
+                except OSError:
+                    self.unsaved[:0] = entries  # Written in one go, so none of it was; try again next time
+                    raise
+                # Someone writing to the storage directly got to these first, theirs stands
+                for change, status, version in lost:
+                    record = self.index.by_id[change["ID"]]
+                    record.status, record.version = requisition.Status.parse(status), version
+                    corrected.append(record)
+                if lost:
+                    requisition.log.warning("%s changes lost to ones made directly in %s",
+                                            len(lost), self.storage.path)
+                    self.index.orders.update(corrected)
+                if self.index.signature == before:
+                    self.index.signature = after
+            before = dict(self.index.by_id)
+            changes = await asyncio.to_thread(self.index.read_changes, self.index.signature)
+            self.index.loaded(changes)
+            self.publish(before, stations, corrected)
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                requisition.log.error("Error saving requisitions: %s", e)
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        try:
+            if method == "GET" and url.path == "/state":
+                return 200, self.state()
+            if method == "GET" and url.path == "/requisitions":
+                return 200, self.list_requisitions(params)
+            if method == "GET" and url.path == "/changes":
+                return 200, self.changes(params)
+            if method == "POST" and url.path in ("/requisitions", "/status"):
+                payload = json.loads(body or b"null")
+                async with self.lock:  # Not while a flush is reading the storage back
+                    return 200, self.add(payload) if url.path == "/requisitions" else self.set_status(payload)
+            raise HTTPError(404, f"No {method} {url.path}")
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": f"Bad request: {e!r}"}
+
+    async def handle_connection(self, reader, writer):
+        # Connections are kept open, so a station pays for the TCP handshake once
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self.dispatch(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        """ Serve until cancelled, then save what is left and compact the storage """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.address = server.sockets[0].getsockname()[:2]
+        requisition.log.warning("Serving %s requisitions on http://%s:%s",
+                                len(self.index.requisitions), *self.address)
+        flusher = asyncio.create_task(self.flush_periodically())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            flusher.cancel()
+            for writer in list(self.connections):
+                writer.close()  # Idle stations keep theirs open; their handlers see the end of the stream
+            await asyncio.sleep(0)
+            await self.flush()
+            await asyncio.to_thread(self.storage.compact)
+
+
+async def read_request(reader):
+    """ (method, target, headers, body) of the next request, or None once the client hung up """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the requisition log in memory for every station.")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to serve other machines as well")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--storage", choices=["xml", "sqlite"], help="defaults to REQUISITION_STORAGE")
+    parser.add_argument("--flush-seconds", type=float, default=1.0, help="how often changes are saved")
+    args = parser.parse_args(argv)
+    requisition.configure_logging()
+
+    backend = args.storage or requisition.STORAGE_BACKEND
+    if backend == "service":
+        raise SystemExit("The server needs the files or the database, give --storage xml or sqlite")
+    service = RequisitionService(requisition.get_storage(backend), args.flush_seconds)
+    service.load()
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from req_trello import Board, BoardStore, Card, List
+
+
+def board_with_cards(*counts):
+    board = Board("Test")
+    for number, count in enumerate(counts):
+        list = List(f"List {number}")
+        board.add_list(list)
+        for card_number in range(count):
+            board.add_card(list.id, Card(f"{list.name} card {card_number}", ""))
+    return board
+
+
+def titles(list):
+    return [card.title for card in list.ordered()]
+
+
+def board_titles(board):
+    return {list.name: titles(list) for list in board.lists.values()}
+
+
+def test_save_writes_only_what_changed(tmp_path):
+    store = BoardStore(str(tmp_path / 'board.db'))
+    board = board_with_cards(3, 2)
+    assert store.save(board) == 2 + 5
+    assert not board.is_dirty()
+
+    first, second = board.lists.values()
+    card = first.ordered()[1]
+    board.update_card(card.id, title="Renamed")
+    board.comment_card(card.id, "Ordered from the supplier")
+    statements = []
+    store.connection.set_trace_callback(statements.append)
+    assert store.save(board) == 1
+    assert [statement for statement in statements if card.id in statement] != []
+    assert not any(other.id in statement for statement in statements
+                   for other in board.cards.values() if other is not card)
+    assert store.save(board) == 0
+
+    reloaded = BoardStore(str(tmp_path / 'board.db')).load("Test")
+    assert reloaded.cards[card.id].title == "Renamed"
+    assert reloaded.cards[card.id].comments == ["Ordered from the supplier"]
+
+
+def test_deleted_cards_stay_deleted(tmp_path):
+    store = BoardStore(str(tmp_path / 'board.db'))
+    board = board_with_cards(3)
+    store.save(board)
+    list = next(iter(board.lists.values()))
+    board.delete_card(list.ordered()[0].id)
+    assert store.save(board) == 1
+
+    reloaded = store.load("Test")
+    assert board_titles(reloaded) == {"List 0": ["List 0 card 1", "List 0 card 2"]}
+
+
+def test_order_survives_a_reload_after_renumbering(tmp_path):
+    store = BoardStore(str(tmp_path / 'board.db'))
+    board = board_with_cards(2)
+    list = next(iter(board.lists.values()))
+    store.save(board)
+    # Each new card goes between the first card and the last one put there, until the positions run out
+    before = list.ordered()[1]
+    renumbered = False
+    for number in range(80):
+        card = Card(f"Squeezed {number}", "")
+        board.add_card(list.id, card)
+        board.move_card(card.id, list.id, before.id)
+        before = card
+        renumbered = renumbered or len(board.dirty_cards) > 1
+        store.save(board)
+    assert renumbered
+    positions = [card.position for card in list.ordered()]
+    assert positions == sorted(positions) and len(set(positions)) == len(positions)
+
+    reloaded = store.load("Test")
+    assert board_titles(reloaded) == board_titles(board)
+
+
+def test_move_card_between_lists(tmp_path):
+    store = BoardStore(str(tmp_path / 'board.db'))
+    board = board_with_cards(3, 2)
+    store.save(board)
+    first, second = board.lists.values()
+    moving = first.ordered()[0]
+
+    board.move_card(moving.id, second.id, second.ordered()[1].id)
+    assert board.dirty_cards == {moving.id}
+    assert titles(first) == ["List 0 card 1", "List 0 card 2"]
+    assert titles(second) == ["List 1 card 0", "List 0 card 0", "List 1 card 1"]
+    board.move_card(first.ordered()[1].id, second.id)  # To the end
+    assert store.save(board) == 2
+
+    assert board_titles(store.load("Test")) == {
+        "List 0": ["List 0 card 1"],
+        "List 1": ["List 1 card 0", "List 0 card 0", "List 1 card 1", "List 0 card 2"]}
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import cli
+import requisition
+from requisition import LineItem, Requisition, Status
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    file_path = str(tmp_path / 'log_data.xml')
+    requisition.write_snapshot([
+        Requisition('a', 'SHEQ', '2024-10-14 07:59', Status.PENDING, 'Stores', [LineItem('M12 Nut', 4)]),
+    ], file_path)
+    storage = requisition.XmlJournalStorage(file_path, str(tmp_path / 'log_data.journal'), str(tmp_path / 'archive'))
+    monkeypatch.setattr(requisition, 'get_storage', lambda backend=None: storage)
+    monkeypatch.setattr(requisition, 'load_stock_items', lambda: requisition.StockCatalogue(['M12 Nut']))
+    return storage
+
+
+def import_lines(tmp_path, capsys, rows, *options):
+    path = tmp_path / 'import.jsonl'
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows), encoding='utf-8')
+    cli.main(['import', str(path), *options])
+    return capsys.readouterr().out.strip()
+
+
+def test_import_matches_rows_with_an_id_on_the_id(tmp_path, capsys, storage):
+    row = {"ID": "feed0001", "Requester": "SHEQ", "Date": "2024-10-14 07:59", "Items": [["M12 Nut", 2]]}
+    assert import_lines(tmp_path, capsys, [row]) == "Imported 1 requisitions, 0 already there, 0 rejected"
+    assert import_lines(tmp_path, capsys, [row]) == "Imported 0 requisitions, 1 already there, 0 rejected"
+    assert [req.id for req in storage.load()] == ['a', 'feed0001']
+
+
+def test_import_matches_rows_without_an_id_on_the_date_they_came_with(tmp_path, capsys, storage):
+    undated = {"Requester": "Roy", "Items": [["M12 Nut", 1]]}
+    dated = {"Requester": "SHEQ", "Date": "2024-10-14 07:59", "Items": [["M12 Nut", 1]]}
+    # Separate batches in the same minute get the same filled in Date, they are still different requisitions
+    assert import_lines(tmp_path, capsys, [undated, undated, dated], '--batch-size', '1') == \
+        "Imported 2 requisitions, 1 already there, 0 rejected"
+    assert [req.requester for req in storage.load()] == ['SHEQ', 'Roy', 'Roy']
+
+
+def test_export_lists_a_requisition_in_the_log_and_the_archive_once(tmp_path, capsys, storage):
+    # What an archive run leaves behind when another station rewrote the log first
+    old = Requisition('o', 'Roy', '2023-01-05 08:00', Status.COMPLETED, 'Stores', [LineItem('M12 Nut', 1)])
+    storage.add(old)
+    (tmp_path / 'archive').mkdir()
+    requisition.write_snapshot([old], requisition.archive_partition_path(str(tmp_path / 'archive'), '2023-01'))
+
+    cli.main(['export', '--archived', '--format', 'json'])
+    exported = [json.loads(line)["ID"] for line in capsys.readouterr().out.splitlines()]
+    assert exported == ['a', 'o']
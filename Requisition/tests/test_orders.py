@@ -0,0 +1,65 @@
+from requisition import LineItem, PendingOrders, Requisition, Status, purchase_order_rows
+
+
+def make_requisition(req_id, department, items, status=Status.PENDING):
+    return Requisition(id=req_id, requester='Roy', date='2024-10-01 08:00', status=status, department=department,
+                       items=[LineItem(name, quantity) for name, quantity in items])
+
+
+def order_lines(orders, **kwargs):
+    return {(line.name, line.department): (line.quantity, line.other_quantities, line.orders)
+            for line in orders.purchase_order(**kwargs)}
+
+
+def test_pending_orders_follow_status_changes():
+    stores = make_requisition('a', 'Stores', [('M12 Nut', 4), ('Bearing 6205', 'a box')])
+    workshop = make_requisition('b', 'Workshop', [(' m12 nut ', 6), ('Bearing 6205', 'a box')])
+    done = make_requisition('c', 'Stores', [('Grease', 1)], status=Status.COMPLETED)
+    orders = PendingOrders.build([stores, workshop, done])
+
+    assert order_lines(orders) == {
+        ('Bearing 6205', ''): (0, {'a box': 2}, 2),
+        ('M12 Nut', ''): (10, {}, 2),
+    }
+    assert order_lines(orders, by_department=True) == {
+        ('Bearing 6205', 'Stores'): (0, {'a box': 1}, 1),
+        ('M12 Nut', 'Stores'): (4, {}, 1),
+        ('Bearing 6205', 'Workshop'): (0, {'a box': 1}, 1),
+        ('m12 nut', 'Workshop'): (6, {}, 1),
+    }
+
+    # Handing it requisitions whose status did not change counts nothing twice
+    orders.update([stores, done])
+    assert order_lines(orders)[('M12 Nut', '')] == (10, {}, 2)
+
+    workshop.status = Status.COMPLETED
+    done.status = Status.PENDING
+    orders.update([workshop, done])
+    assert order_lines(orders) == {
+        ('Bearing 6205', ''): (0, {'a box': 1}, 1),
+        ('Grease', ''): (1, {}, 1),
+        ('M12 Nut', ''): (4, {}, 1),
+    }
+
+    stores.status = Status.COMPLETED
+    done.status = Status.COMPLETED
+    orders.update([stores, done])
+    assert orders.lines == {}
+    assert orders.purchase_order() == []
+
+
+def test_purchase_order_flags_items_not_in_stock():
+    orders = PendingOrders.build([
+        make_requisition('a', 'Stores', [('M12 Nut', 4), ('Bearing 6205', 'a box'), ('Bearing 6205', 'a box')]),
+        make_requisition('b', 'Stores', [('Bearing 6205', 'two'), ('Custom bracket', 1)]),
+    ])
+    lines = orders.purchase_order(stock_items=['  m12 nut', 'Bearing 6205  '])
+    assert [(line.name, line.in_stock) for line in lines] == [
+        ('Bearing 6205', True), ('Custom bracket', False), ('M12 Nut', True)]
+    assert list(purchase_order_rows(lines)) == [
+        ['Bearing 6205', '', '', 'a box x2; two', 3, ''],
+        ['Custom bracket', '', 1, '', 1, 'Not in stock list'],
+        ['M12 Nut', '', 4, '', 1, ''],
+    ]
+    # Without a stock list nothing is flagged
+    assert all(line.in_stock for line in orders.purchase_order())
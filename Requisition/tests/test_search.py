@@ -0,0 +1,60 @@
+from requisition import LineItem, Requisition, SearchIndex, Status, StockCatalogue
+
+
+def make_requisition(req_id, requester, department, items, date='2024-10-01 08:00', status=Status.PENDING):
+    return Requisition(id=req_id, requester=requester, date=date, status=status, department=department,
+                       items=[LineItem(name, 1) for name in items])
+
+
+def ids(requisitions):
+    return [req.id for req in requisitions]
+
+
+def test_search_ranks_by_field_and_whole_words():
+    index = SearchIndex.build([
+        make_requisition('r1', 'Roy', 'Stores', ['Bearing']),
+        make_requisition('r2', 'Bearing', 'Stores', ['Nut']),
+        make_requisition('r3', 'Roy', 'Bearing', ['Nut']),
+        make_requisition('r4', 'Roy', 'Stores', ['Bearings'], date='2024-10-02 08:00'),
+    ])
+    # Requester beats department beats item, and a whole word beats a longer word it starts
+    assert ids(index.search('bearing')) == ['r2', 'r3', 'r1', 'r4']
+    assert ids(index.search('bearing', limit=2)) == ['r2', 'r3']
+    # Every word has to match
+    assert ids(index.search('roy bearing')) == ['r3', 'r1', 'r4']
+    assert index.search('roy nothing') == []
+
+
+def test_search_matches_prefixes():
+    index = SearchIndex.build([
+        make_requisition('a1', 'Roy', 'Stores', ['M12 Nut'], date='2024-10-01 08:00'),
+        make_requisition('a2', 'Rosa', 'Workshop', ['M10 Bolt'], date='2024-10-03 08:00'),
+        make_requisition('a3', 'Pat', 'Stores', ['Washer'], date='2024-10-02 08:00', status=Status.COMPLETED),
+    ])
+    # Equal scores come newest first
+    assert ids(index.search('ro')) == ['a2', 'a1']
+    assert ids(index.search('st')) == ['a3', 'a1']
+    assert ids(index.search('st', status=Status.PENDING)) == ['a1']
+    assert ids(index.search('m1')) == ['a2', 'a1']
+    assert ids(index.search('')) == ['a2', 'a3', 'a1']
+
+    index.add(make_requisition('a4', 'Robin', 'Stores', ['Nut'], date='2024-10-04 08:00'))
+    assert ids(index.search('ro')) == ['a4', 'a2', 'a1']
+    assert ids(index.search('nut st')) == ['a4', 'a1']
+
+
+def test_stock_search_ranks_and_limits():
+    catalogue = StockCatalogue(['Nut M12', 'M12 Bolt', 'Washer M12', 'M12', 'Hex nut', 'Nutcase', 'Peanut'])
+    # Exact name, then names starting with it, then words starting with it, then anywhere in a name
+    assert catalogue.search('m12') == ['M12', 'M12 Bolt', 'Nut M12', 'Washer M12']
+    assert catalogue.search(' NUT ') == ['Nut M12', 'Nutcase', 'Hex nut', 'Peanut']
+    assert catalogue.search('m12 b') == ['M12 Bolt']
+    assert catalogue.search('bolts') == []
+    assert catalogue.search('nut', limit=2) == ['Nut M12', 'Nutcase']
+
+    # Short queries take names, then words, then the rest in that order
+    assert catalogue.search('nu') == ['Nut M12', 'Nutcase', 'Hex nut', 'Peanut']
+    assert catalogue.search('w', limit=1) == ['Washer M12']
+    assert catalogue.search('') == list(catalogue)
+    assert catalogue.search('', limit=2) == ['Nut M12', 'M12 Bolt']
+    assert 'Hex nut' in catalogue and 'hex nut' not in catalogue
@@ -0,0 +1,143 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+import requisition
+import server
+from requisition import LineItem, Requisition, Status
+
+
+def make_requisition(req_id, status=Status.PENDING):
+    return Requisition(req_id, 'Roy', '2024-10-01 08:00', status, 'Stores', [LineItem('M12 Nut', 4)])
+
+
+class RunningServer:
+    """ server.py serving a SQLite storage on a free localhost port, on its own event loop thread """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.service = server.RequisitionService(requisition.SqliteStorage(db_path), flush_seconds=3600)
+        self.service.load()
+        self.loop = asyncio.new_event_loop()
+        self.task = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while self.service.address is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.url = 'http://%s:%s' % tuple(self.service.address)
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.task = self.loop.create_task(self.service.serve('127.0.0.1', 0))
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+
+    def flush(self):
+        asyncio.run_coroutine_threadsafe(self.service.flush(), self.loop).result(10)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(10)
+        self.loop.close()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection(*self.service.address, timeout=10)
+        try:
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+
+@pytest.fixture
+def running(tmp_path):
+    db_path = str(tmp_path / 'requisitions.db')
+    requisition.SqliteStorage(db_path).add_many([make_requisition('a'), make_requisition('b')])
+    running = RunningServer(db_path)
+    yield running
+    running.stop()
+
+
+def station(running):
+    index = requisition.RequisitionIndex(requisition.ServiceStorage(running.url))
+    index.validate()
+    events = []
+    index.subscribe(lambda event, req=None, old_status=None: events.append((event, req)))
+    return index, events
+
+
+def statuses(requisitions):
+    return {req.id: (str(req.status), req.version) for req in requisitions}
+
+
+def test_stations_see_each_others_changes_over_one_connection(running):
+    first, _ = station(running)
+    second, events = station(running)
+    connection = first.storage.connection
+
+    first.add(make_requisition('c'))
+    first.set_status(first.by_id['a'], Status.COMPLETED)
+    second.validate()
+
+    assert first.storage.connection is connection  # Kept alive between requests
+    assert statuses(second.requisitions) == {'a': ('Completed', 1), 'b': ('Pending', 0), 'c': ('Pending', 0)}
+    assert [event for event, _ in events] == ['merged']
+    assert [req.id for req in second.storage.iter_matching(status=Status.PENDING)] == ['b', 'c']
+
+
+def test_a_change_made_from_an_old_version_is_turned_away(running):
+    first, _ = station(running)
+    second, _ = station(running)
+    first.set_status(first.by_id['a'], Status.COMPLETED)
+
+    with pytest.raises(requisition.ConflictError):
+        second.storage.set_status_many([(second.by_id['a'], 1), (second.by_id['b'], 1)], Status.COMPLETED)
+    second.validate()
+    assert statuses(second.requisitions) == {'a': ('Completed', 1), 'b': ('Pending', 0)}
+
+
+def test_saved_changes_reach_the_storage_and_lost_ones_their_station(running):
+    first, events = station(running)
+    other, _ = station(running)
+    requisition.SqliteStorage(running.db_path).set_status(make_requisition('a'), 'Cancelled', 1)  # Directly
+
+    first.set_status(first.by_id['a'], Status.COMPLETED)
+    first.set_status(first.by_id['b'], Status.COMPLETED)
+    running.flush()
+    first.validate()
+    other.validate()
+
+    expected = {'a': ('Cancelled', 1), 'b': ('Completed', 1)}
+    assert statuses(requisition.SqliteStorage(running.db_path).load()) == expected
+    assert statuses(first.requisitions) == statuses(other.requisitions) == expected
+    assert [[req.id for req in reqs] for event, reqs in events if event == 'conflict'] == [['a']]
+
+
+def test_a_station_too_far_behind_loads_everything_again(running):
+    first, events = station(running)
+    running.service.epoch = 'restarted'  # As after the server reloaded its storage
+    running.service.feed.clear()
+    station(running)[0].add(make_requisition('c'))
+
+    first.validate()
+    assert 'c' in first.by_id
+    assert [event for event, _ in events] == ['reloaded']
+
+
+def test_bad_requests(running):
+    assert running.request('GET', '/changes?epoch=old&since=0')[0] == 410
+    assert running.request('POST', '/status', b'{"changes": []}')[0] == 400
+    assert running.request('POST', '/status', b'not json')[0] == 400
+    assert running.request('POST', '/status', json.dumps(
+        {"Status": "Completed", "changes": [{"ID": "nope", "Version": 1}]}).encode())[0] == 404
+    assert running.request('GET', '/nothing')[0] == 404
+    status, state = running.request('GET', '/state')
+    assert status == 200 and state == running.service.state()
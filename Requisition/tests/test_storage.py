@@ -0,0 +1,299 @@
+import asyncio
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import requisition
+import server
+from requisition import LineItem, Requisition, Status
+
+
+def make_requisition(req_id, status=Status.PENDING, date='2024-10-01 08:00'):
+    return Requisition(id=req_id, requester='Roy', date=date, status=status, department='Stores',
+                       items=[LineItem('M12 Nut', 4), LineItem('Bearing 6205', 'a box')])
+
+
+def log_files(tmp_path, requisitions=()):
+    file_path = str(tmp_path / 'log_data.xml')
+    journal_path = str(tmp_path / 'log_data.journal')
+    requisition.write_snapshot(list(requisitions), file_path)
+    return file_path, journal_path
+
+
+def load_index(storage):
+    index = requisition.RequisitionIndex(storage)
+    index.rebuild()
+    return index
+
+
+def statuses(requisitions):
+    return {req.id: (str(req.status), req.version) for req in requisitions}
+
+
+def test_journal_replay(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [make_requisition('a'), make_requisition('b')])
+    storage = requisition.XmlJournalStorage(file_path, journal_path)
+    storage.add(make_requisition('c'))
+    storage.add_many([make_requisition('d'), make_requisition('a')])
+    storage.set_status(make_requisition('a'), Status.COMPLETED, 1)
+    storage.set_status_many([(make_requisition('b'), 1), (make_requisition('c'), 1)], Status.COMPLETED)
+    storage.write_batch([make_requisition('e')],
+                        [{"ID": "b", "Status": "Pending", "Version": 2}, {"ID": "e", "Status": "Completed",
+                                                                         "Version": 1}])
+
+    expected = {'a': ('Completed', 1), 'b': ('Pending', 2), 'c': ('Completed', 1), 'd': ('Pending', 0),
+                'e': ('Completed', 1)}
+    loaded = requisition.load_requisitions(file_path, journal_path)
+    assert [req.id for req in loaded] == ['a', 'b', 'c', 'd', 'e']
+    assert statuses(loaded) == expected
+    assert statuses(requisition.iter_log(file_path, journal_path)) == expected
+    assert list(loaded[0].items) == [('M12 Nut', 4), ('Bearing 6205', 'a box')]
+
+    assert requisition.compact_journal(file_path, journal_path)
+    assert os.path.getsize(journal_path) == 0
+    assert statuses(requisition.load_requisitions(file_path, journal_path)) == expected
+
+
+def test_streamed_log_settles_changes_like_a_full_load(tmp_path):
+    file_path = str(tmp_path / 'log_data.xml')
+    journal_path = str(tmp_path / 'log_data.journal')
+    with open(file_path, 'w', encoding='utf-8') as f:
+        # Written before IDs existed, the first gets a new ID on every load; c and d share Requester and Date
+        f.write("<requisitions>"
+                "<requisition><Requester>Roy</Requester><Date>2024-10-01 10:46</Date><Status>Pending</Status>"
+                "<Department>Stores</Department><Items/></requisition>"
+                "<requisition><ID>b</ID><Requester>Roy</Requester><Date>2024-10-02 09:00</Date>"
+                "<Status>Pending</Status><Department>Stores</Department><Items/></requisition>"
+                "<requisition><ID>c</ID><Requester>SHEQ</Requester><Date>2024-10-14 07:59</Date>"
+                "<Status>Pending</Status><Department>Stores</Department><Items/></requisition>"
+                "<requisition><ID>d</ID><Requester>SHEQ</Requester><Date>2024-10-14 07:59</Date>"
+                "<Status>Pending</Status><Department>Stores</Department><Items/></requisition>"
+                "</requisitions>")
+    storage = requisition.XmlJournalStorage(file_path, journal_path)
+    loaded = requisition.load_requisitions(file_path, journal_path)
+    # The window completed the ID-less one under the ID it was given that time, then b and d by their own
+    storage.set_status(loaded[0], Status.COMPLETED, 1)
+    storage.set_status(loaded[1], 'Cancelled', 1)
+    storage.set_status(loaded[3], Status.COMPLETED, 1)
+
+    def settled(requisitions):
+        return sorted((req.requester, req.id if req.id in 'bcd' else '-', str(req.status)) for req in requisitions)
+
+    expected = [('Roy', '-', 'Completed'), ('Roy', 'b', 'Cancelled'),
+                ('SHEQ', 'c', 'Pending'), ('SHEQ', 'd', 'Completed')]
+    assert settled(requisition.load_requisitions(file_path, journal_path)) == expected
+    assert settled(requisition.iter_log(file_path, journal_path)) == expected
+
+
+def test_first_change_in_the_journal_wins(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [make_requisition('a'), make_requisition('b')])
+    first = load_index(requisition.XmlJournalStorage(file_path, journal_path))
+    second = load_index(requisition.XmlJournalStorage(file_path, journal_path))
+    events = []
+    second.subscribe(lambda event, req=None, old_status=None: events.append((event, req)))
+
+    first.set_status(first.by_id['a'], Status.COMPLETED)
+    second.set_status(second.by_id['a'], 'Cancelled')  # Made from the same version, but written second
+    second.set_status(second.by_id['b'], Status.COMPLETED)
+    second.validate()
+
+    assert second.by_id['a'].status == Status.COMPLETED
+    assert second.by_id['b'].status == Status.COMPLETED
+    assert [(event, [req.id for req in reqs]) for event, reqs in events if event == 'conflict'] == [('conflict', ['a'])]
+    assert statuses(requisition.load_requisitions(file_path, journal_path)) == {
+        'a': ('Completed', 1), 'b': ('Completed', 1)}
+
+
+class QueuedWorker:
+    """ Stands in for IOWorker: runs the queued work only when asked, like a slow share """
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, work, on_done=None, on_error=None, coalesce_key=None):
+        self.tasks.append((work, on_done))
+
+    def run_queued(self):
+        tasks, self.tasks = self.tasks, []
+        for work, on_done in tasks:
+            result = work()
+            if on_done:
+                on_done(result)
+
+
+@pytest.mark.parametrize('backend', ['xml', 'sqlite'])
+def test_queued_add_writes_the_requisition_as_it_was_added(tmp_path, backend):
+    if backend == 'xml':
+        storage = requisition.XmlJournalStorage(*log_files(tmp_path))
+    else:
+        storage = requisition.SqliteStorage(str(tmp_path / 'requisitions.db'))
+    index = load_index(storage)
+    index.worker = QueuedWorker()
+
+    index.add(make_requisition('a'))
+    index.add_many([make_requisition('b')])
+    index.set_status(index.by_id['a'], Status.COMPLETED)  # Before the add has been written
+    index.set_status(index.by_id['b'], Status.COMPLETED)
+    index.worker.run_queued()
+
+    assert statuses(storage.load()) == {'a': ('Completed', 1), 'b': ('Completed', 1)}
+    if backend == 'xml':
+        added = [entry for entry in requisition.read_journal(storage.journal_path) if entry['op'] in ('add', 'adds')]
+        assert [journal_entry_status(entry) for entry in added] == [('Pending', None), ('Pending', None)]
+
+
+def journal_entry_status(entry):
+    data = entry['requisition'] if entry['op'] == 'add' else entry['requisitions'][0]
+    return data['Status'], data.get('Version')
+
+
+def test_sqlite_conflict_rolls_back_the_batch(tmp_path):
+    db_path = str(tmp_path / 'requisitions.db')
+    requisition.SqliteStorage(db_path).add_many([make_requisition('a'), make_requisition('b')])
+    first = load_index(requisition.SqliteStorage(db_path))
+    second = load_index(requisition.SqliteStorage(db_path))
+
+    first.set_status(first.by_id['a'], Status.COMPLETED)
+    with pytest.raises(requisition.ConflictError):
+        second.storage.set_status_many([(second.by_id['a'], 1), (second.by_id['b'], 1)], 'Cancelled')
+
+    assert statuses(requisition.SqliteStorage(db_path).load()) == {'a': ('Completed', 1), 'b': ('Pending', 0)}
+
+
+def test_sqlite_filters_match_date_prefixes_like_the_log(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [
+        make_requisition('a', date='2024-09-30 16:00'), make_requisition('b', date='2024-10-01 07:30'),
+        make_requisition('c', Status.COMPLETED, '2024-10-01 16:45'), make_requisition('d', date='2024-10-02 08:00')])
+    storage = requisition.SqliteStorage(str(tmp_path / 'requisitions.db'))
+    storage.add_many(requisition.load_requisitions(file_path, journal_path))
+
+    for filters, expected in [({'date_from': '2024-10-01', 'date_to': '2024-10-01'}, ['b', 'c']),
+                              ({'date_from': '2024-10', 'status': Status.PENDING}, ['b', 'd']),
+                              ({'date_to': '2024-09', 'department': 'Stores'}, ['a'])]:
+        assert [req.id for req in storage.iter_matching(**filters)] == expected
+        assert [req.id for req in requisition.XmlJournalStorage(file_path, journal_path).iter_matching(
+            **filters)] == expected
+
+
+def test_sqlite_write_batch_keeps_the_changes_that_did_not_conflict(tmp_path):
+    db_path = str(tmp_path / 'requisitions.db')
+    storage = requisition.SqliteStorage(db_path)
+    storage.add_many([make_requisition('a'), make_requisition('b')])
+    requisition.SqliteStorage(db_path).set_status(make_requisition('a'), Status.COMPLETED, 1)
+
+    lost = storage.write_batch([make_requisition('c')], [{"ID": "a", "Status": "Cancelled", "Version": 1},
+                                                         {"ID": "b", "Status": "Cancelled", "Version": 1}])
+
+    assert [(change['ID'], status, version) for change, status, version in lost] == [('a', 'Completed', 1)]
+    assert statuses(storage.load()) == {'a': ('Completed', 1), 'b': ('Cancelled', 1), 'c': ('Pending', 0)}
+
+
+def test_server_flush_reports_lost_changes_to_their_station(tmp_path):
+    db_path = str(tmp_path / 'requisitions.db')
+    requisition.SqliteStorage(db_path).add_many([make_requisition('a'), make_requisition('b')])
+    service = server.RequisitionService(requisition.SqliteStorage(db_path))
+    service.load()
+    requisition.SqliteStorage(db_path).set_status(make_requisition('a'), 'Cancelled', 1)  # Not through the server
+
+    service.set_status({"Status": "Completed", "Station": "station-1",
+                        "changes": [{"ID": "a", "Version": 1}, {"ID": "b", "Version": 1}]})
+    version = service.version
+    asyncio.run(service.flush())
+
+    assert statuses(requisition.SqliteStorage(db_path).load()) == {'a': ('Cancelled', 1), 'b': ('Completed', 1)}
+    assert statuses(service.index.requisitions) == {'a': ('Cancelled', 1), 'b': ('Completed', 1)}
+    entries = service.changes({"epoch": service.epoch, "since": version})["entries"]
+    assert entries == [{"op": "corrections", "changes": [
+        {"ID": "a", "Requester": "Roy", "Date": "2024-10-01 08:00", "Status": "Cancelled", "Version": 1,
+         "Station": "station-1"}]}]
+
+
+def append_requisitions(file_path, journal_path, prefix, count):
+    storage = requisition.XmlJournalStorage(file_path, journal_path)
+    for number in range(count):
+        storage.add(make_requisition(f'{prefix}{number:03d}'))
+        time.sleep(0.002)  # Spread out like stations, so compactions land in between
+
+
+def compact_until(file_path, journal_path, done, compactions):
+    while not done.is_set():
+        if requisition.compact_journal(file_path, journal_path):
+            compactions.value += 1
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_appends_survive_concurrent_compaction(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [make_requisition(f'old{number}') for number in range(200)])
+    context = multiprocessing.get_context('fork')
+    done, compactions = context.Event(), context.Value('i', 0)
+    compactor = context.Process(target=compact_until, args=(file_path, journal_path, done, compactions))
+    stations = [context.Process(target=append_requisitions, args=(file_path, journal_path, prefix, 60))
+                for prefix in 'xyz']
+    compactor.start()
+    for station in stations:
+        station.start()
+    for station in stations:
+        station.join(60)
+        assert station.exitcode == 0
+    done.set()
+    compactor.join(60)
+    assert compactor.exitcode == 0
+    assert compactions.value > 1
+
+    ids = [req.id for req in requisition.load_requisitions(file_path, journal_path)]
+    assert len(ids) == len(set(ids)) == 200 + 3 * 60
+    requisition.compact_journal(file_path, journal_path)
+    assert len(requisition.load_requisitions(file_path, journal_path)) == 380
+
+
+def test_damaged_log_is_not_rewritten(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [make_requisition(f'r{number}') for number in range(50)])
+    requisition.append_journal({"op": "add", "requisition": make_requisition('new').to_dict()}, journal_path)
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    with open(file_path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    assert 0 < len(requisition.load_requisitions(file_path, journal_path)) < 51
+    with pytest.raises(requisition.ET.ParseError):
+        requisition.load_requisitions(file_path, journal_path, strict=True)
+    assert not requisition.XmlJournalStorage(file_path, journal_path, str(tmp_path / 'archive')).compact()
+    assert os.path.getsize(file_path) == len(data) // 2
+    assert os.path.getsize(journal_path) > 0
+
+
+def test_compact_on_close_survives_a_held_lock(tmp_path, monkeypatch):
+    file_path, journal_path = log_files(tmp_path, [make_requisition('a', Status.COMPLETED, '2020-01-01 08:00')])
+    storage = requisition.XmlJournalStorage(file_path, journal_path, str(tmp_path / 'archive'))
+    storage.add(make_requisition('b'))
+
+    def locked(*args, **kwargs):
+        raise TimeoutError(f"{journal_path} is locked by another station")
+
+    monkeypatch.setattr(requisition, 'ARCHIVE_AFTER_DAYS', 90)
+    monkeypatch.setattr(requisition, 'archive_completed', locked)
+    assert storage.compact() is False
+    assert [req.id for req in requisition.load_requisitions(file_path, journal_path)] == ['a', 'b']
+
+
+def test_warm_start_is_dropped_after_an_edit_that_keeps_the_size(tmp_path):
+    file_path, journal_path = log_files(tmp_path, [
+        make_requisition(f'r{number:03d}', Status.COMPLETED if number % 3 else Status.PENDING) for number in range(300)])
+    storage = requisition.XmlJournalStorage(file_path, journal_path)
+    storage.write_warm_start(requisition.load_requisitions(file_path, journal_path), storage.signature())
+
+    (signature, pending), requisitions = storage.read_warm_start()
+    assert [req.id for req in pending] == [f'r{number:03d}' for number in range(0, 300, 3)]
+    assert statuses(requisitions) == statuses(requisition.load_requisitions(file_path, journal_path))
+    assert all(req is requisitions[int(req.id[1:])] for req in pending)
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    middle = data.index(b'<ID>r150</ID>')
+    with open(file_path, 'wb') as f:
+        f.write(data[:middle] + b'<ID>r999</ID>' + data[middle + len(b'<ID>r150</ID>'):])
+    os.utime(file_path, ns=(os.stat(file_path).st_atime_ns, os.stat(file_path).st_mtime_ns + 1))
+
+    assert list(storage.read_warm_start()) == []